@@ -0,0 +1,156 @@
+import logging
+from fnmatch import fnmatch
+from typing import Dict, List, Optional
+
+from repository import GitRepository
+from stats import is_ignored_dir
+from topn import DEFAULT_TOP_N, TopN
+
+
+# Files whose churn is measured, the same ones as the code metrics
+CHURN_PATTERN = "*.py"
+
+# Fields of the per-file churn
+ADDED, REMOVED, COMMITS = range(3)
+
+
+def is_ignored_path(path: str) -> bool:
+    # A file is ignored when any of its folders is, as in the code metrics
+    parts = path.split("/")
+    return parts[-1].startswith(".") or any(
+        is_ignored_dir("/".join(parts[: i + 1])) for i in range(len(parts) - 1)
+    )
+
+
+# Lines added and removed and number of commits per file of each release of
+# the analysed window. The history of the whole window is read from a single
+# `git log --numstat` streamed one commit at a time. The tags reaching each
+# commit are carried from children to parents along the way, and the churn is
+# summed up by set of tags. Each commit then goes to the first of its tags in
+# history order, as in `git log <previous>..<tag>`, and each release is
+# compared with its nearest ancestor tag, so tags of stable branches released
+# between main releases only get their own commits.
+class ChurnAnalyzer:
+    def __init__(
+        self,
+        collection: Dict,
+        repo: GitRepository,
+        tags: List[str],
+        top_n=DEFAULT_TOP_N,
+    ):
+        self.collection = collection
+        self.repo = repo
+        self.tags = sorted(tags, key=repo.tag_date)
+        self.top_n = top_n
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.setLevel(logging.DEBUG)
+        # Commit of each tag and mask of the tags reaching it, see analyze
+        self._commits: List[Optional[str]] = []
+        self._reached_by: Dict[str, int] = {}
+
+    def analyze(self) -> Dict:
+        # Churn of each release but the first one of the window
+        if len(self.tags) < 2:
+            return {}
+
+        # Bit i of the mask of a commit is set when self.tags[i] reaches it, the
+        # masks of the commits still to be read are kept
+        self._commits = [self.repo.tag_commit(tag) for tag in self.tags]
+        masks: Dict[str, int] = {}
+        for i, commit in enumerate(self._commits):
+            if commit is not None:
+                masks[commit] = masks.get(commit, 0) | 1 << i
+        tagged = set(self._commits)
+        self._reached_by = {}
+        churn_by_mask: Dict[int, Dict[str, List[int]]] = {}
+        num_commits = 0
+
+        # The commit of the first tag is read as a boundary commit, to find the
+        # releases it is an ancestor of
+        releases = self.tags[1:]
+        revs = [*releases, f"^{self.tags[0]}"]
+        for sha, parents, boundary, files in self.repo.log_numstat(revs):
+            mask = masks.pop(sha, 0)
+            if sha in tagged:
+                self._reached_by[sha] = mask
+            if boundary:
+                continue
+            for parent in parents:
+                masks[parent] = masks.get(parent, 0) | mask
+            if len(parents) > 1 or not mask:
+                continue
+
+            num_commits += 1
+            churn_files = churn_by_mask.setdefault(mask, {})
+            for path, added, removed in files:
+                if not fnmatch(path, CHURN_PATTERN) or is_ignored_path(path):
+                    continue
+                churn = churn_files.setdefault(path, [0, 0, 0])
+                churn[ADDED] += added
+                churn[REMOVED] += removed
+                churn[COMMITS] += 1
+
+        # Churn of each release, from the commits it is the first tag of
+        intervals: List[Dict[str, List[int]]] = [{} for _ in releases]
+        for mask, churn_files in churn_by_mask.items():
+            i = self._first_tag([i for i in range(len(self.tags)) if mask & 1 << i])
+            for path, churn in churn_files.items():
+                total = intervals[i - 1].setdefault(path, [0, 0, 0])
+                for field in (ADDED, REMOVED, COMMITS):
+                    total[field] += churn[field]
+
+        # Total churn of each file over the window and the top N files by
+        # lines changed
+        totals: Dict[str, List[int]] = {}
+        for files in intervals:
+            for path, churn in files.items():
+                total = totals.setdefault(path, [0, 0, 0])
+                for field in (ADDED, REMOVED, COMMITS):
+                    total[field] += churn[field]
+        top_files = TopN(self.top_n)
+        for path, total in totals.items():
+            top_files.push(self.collection["name"], path, total[ADDED] + total[REMOVED])
+
+        self.logger.debug(
+            f"{self.collection['name']}: {num_commits} commits since "
+            f"{self.tags[0]} in {len(releases)} releases"
+        )
+        return {
+            "releases": [
+                {
+                    "previous": self._previous(i),
+                    "tag": tag,
+                    "files": files,
+                }
+                for i, (tag, files) in enumerate(zip(releases, intervals), 1)
+            ],
+            "files": totals,
+            "top_files": [
+                (path, *totals[path])
+                for path, _ in top_files.top(self.collection["name"])
+            ],
+        }
+
+    def _is_ancestor(self, i: int, j: int) -> bool:
+        # Whether self.tags[i] is an ancestor of self.tags[j], tags of the same
+        # commit aside
+        commit = self._commits[i]
+        return (
+            commit is not None
+            and commit != self._commits[j]
+            and bool(self._reached_by.get(commit, 0) & 1 << j)
+        )
+
+    def _first_tag(self, tags: List[int]) -> int:
+        # Tag none of the others is an ancestor of, the earliest one when the
+        # tags are on separate branches
+        return min(i for i in tags if not any(self._is_ancestor(j, i) for j in tags))
+
+    def _previous(self, i: int) -> Optional[str]:
+        # Nearest ancestor tag of self.tags[i] in the window, the latest one
+        # when several branches were merged
+        ancestors = [j for j in range(len(self.tags)) if self._is_ancestor(j, i)]
+        nearest = [
+            j for j in ancestors if not any(self._is_ancestor(j, k) for k in ancestors)
+        ]
+        return self.tags[max(nearest)] if nearest else None
@@ -1,20 +1,109 @@
 import re
-from typing import Dict
+from typing import Dict, List, Optional
 import pandas as pd
 
+from matcher import MultiPatternMatcher
+from search import SearchIndex
+from topn import DEFAULT_TOP_N, TopN
+
+
+# Time buckets of the changes cube, "release" keeps one bucket per release
+TIME_BUCKETS = {"release": None, "week": "W", "month": "M", "quarter": "Q"}
+DEFAULT_TIME_BUCKET = "release"
+
+# Component prefix of a changelog entry, one or more comma-separated names,
+# quoted or paths, followed by " - ", e.g. "ec2_instance, amazon.aws.ec2_vpc -
+# Fix crash." or "module_utils/botocore - Fix crash."
+COMPONENT_PATTERN = re.compile(r"^\s*(\S+(?:\s*,\s*\S+)*)\s+-\s")
+
 
 def order_dict(d: Dict) -> Dict:
     return {key: d[key] for key in sorted(d.keys())}
 
 
+# Rollup of the number of changes by label x collection x change_type x time
+# bucket. The wide changes_overtime frame is melted once and aggregated once
+# per bucket, and the slices used by the plots are kept ready, so that building
+# a view does not melt or group the data again.
+class ChangesCube:
+    def __init__(self, changes_overtime: pd.DataFrame):
+        changes = changes_overtime.melt(
+            id_vars=["label", "version", "release_date", "collection"],
+            var_name="change_type",
+            value_name="count",
+        ).dropna(subset=["count"])
+
+        # Total changes by label and change type, whatever the bucket
+        self.totals = changes.groupby(["label", "change_type"], as_index=False)[
+            "count"
+        ].sum()
+
+        self.buckets: Dict[str, pd.DataFrame] = {}
+        self.collections: Dict[str, Dict[str, pd.DataFrame]] = {}
+        self.types: Dict[str, Dict[str, pd.DataFrame]] = {}
+        self.labels: Dict[str, pd.DataFrame] = {}
+        for bucket, freq in TIME_BUCKETS.items():
+            if freq is None:
+                # A release is its own bucket, starting at its release date
+                frame = changes.assign(period=changes["release_date"])
+                keys = ["label", "collection", "change_type", "version", "period"]
+            else:
+                frame = changes.assign(
+                    period=changes["release_date"].dt.to_period(freq).dt.start_time
+                )
+                keys = ["label", "collection", "change_type", "period"]
+            frame = frame.groupby(keys, as_index=False, sort=False, dropna=False)[
+                "count"
+            ].sum()
+
+            self.buckets[bucket] = frame
+            self.collections[bucket] = dict(
+                tuple(frame.groupby("collection", sort=False))
+            )
+            self.types[bucket] = dict(tuple(frame.groupby("change_type", sort=False)))
+            self.labels[bucket] = (
+                frame.groupby(["label", "period"], as_index=False)["count"]
+                .sum()
+                .sort_values("period")
+            )
+
+    def collection(self, bucket: str, collection: str) -> pd.DataFrame:
+        return self.collections[bucket][collection]
+
+    def change_types(self, bucket: str, change_types) -> pd.DataFrame:
+        frames = [
+            self.types[bucket][change_type]
+            for change_type in change_types
+            if change_type in self.types[bucket]
+        ]
+        return pd.concat(frames) if frames else self.buckets[bucket].iloc[0:0]
+
+    def label_trend(self, bucket: str) -> pd.DataFrame:
+        return self.labels[bucket]
+
+
 class InsightsGenerator:
-    def __init__(self, data: Dict, limit):
+    def __init__(
+        self,
+        data: Dict,
+        limit,
+        top_n=DEFAULT_TOP_N,
+        plugin_files: Optional[Dict[str, Dict[str, str]]] = None,
+    ):
         self.data = self._cleanup_changelog_data(data)
         self.limit = limit
+        self.top_n = top_n
+        # Plugin and module files of each collection, keyed by plugin name
+        self.plugin_files = plugin_files or {}
+        changes_overtime = self._extract_changes_overtime()
+        most_updated_files, file_updates = self._extract_most_updated_files()
         self.counts = {
-            "changes_overtime": self._extract_changes_overtime(),
-            "most_updated_files": self._extract_most_updated_files(),
+            "changes_overtime": changes_overtime,
+            "changes_cube": ChangesCube(changes_overtime),
+            "most_updated_files": most_updated_files,
+            "file_updates": file_updates,
             "flatten": self._extract_total_releases(),
+            "search_index": self._build_search_index(),
         }
 
     def _extract_total_releases(self):
@@ -36,13 +125,35 @@ class InsightsGenerator:
 
         return df
 
+    def _build_search_index(self) -> SearchIndex:
+        # Index every changelog entry of every release, the limit only applies
+        # to the plotted insights
+        index = SearchIndex()
+        for label, collections in self.data.items():
+            for collection, releases in collections.items():
+                for version, details in order_dict(releases).items():
+                    release_date = details.get("release_date")
+                    for category, entries in details.items():
+                        if not isinstance(entries, list):
+                            continue
+                        for entry in entries:
+                            index.add(
+                                label,
+                                collection,
+                                version,
+                                release_date,
+                                category,
+                                str(entry),
+                            )
+        return index.freeze()
+
     def get_x_items_from_dict(self, d: Dict) -> Dict:
         # Convert dictionary items to a list and slice the last x items
         last_x_items = list(d.items())[-self.limit :]
         # Convert the sliced list back to a dictionary
         return dict(last_x_items)
 
-    def _extract_most_updated_files(self) -> Dict:
+    def _extract_most_updated_files(self):
         # Regex pattern for matching individual entries
         entry_pattern = re.compile(r"^([^\s]+)\s+-\s+(.+)")
 
@@ -70,11 +181,25 @@ class InsightsGenerator:
                     result.append(re.sub(r"\W+", "", elem).lower())
             return [term for term in result if term]  # Filter out empty terms
 
-        release_data = []
+        top_files = TopN(self.top_n)
 
-        # Flatten the data into a list of dictionaries
+        # Count file occurrences per (label, collection) in a single pass
         for label, collections in self.data.items():
             for collection, versions in collections.items():
+                plugin_files = {
+                    name.lower(): path
+                    for name, path in self.plugin_files.get(collection, {}).items()
+                }
+                if plugin_files:
+                    matcher = MultiPatternMatcher(plugin_files)
+
+                    def extract_files(s):
+                        return self._match_plugin_files(s, matcher, plugin_files)
+
+                else:
+                    # No plugin tree available, guess names from the entry
+                    extract_files = extract_and_split_terms
+
                 if self.limit:
                     sorted_dict = order_dict(versions)
                     versions = self.get_x_items_from_dict(sorted_dict)
@@ -83,35 +208,56 @@ class InsightsGenerator:
                         if key not in ("modules", "plugins"):
                             if isinstance(value, list):
                                 for v in value:
-                                    result = extract_and_split_terms(v)
-                                    if result:
-                                        for file_name in result:
-                                            release_data.append(
-                                                {
-                                                    "label": label,
-                                                    "collection": collection,
-                                                    "file_name": file_name,
-                                                }
-                                            )
-
-        # Create DataFrame from the flattened data
-        df = pd.DataFrame(release_data)
+                                    top_files.count(
+                                        (label, collection), extract_files(str(v))
+                                    )
 
-        # Group by label, collection, and file_name and count occurrences
-        grouped = (
-            df.groupby(["label", "collection", "file_name"])
-            .size()
-            .reset_index(name="count")
-        )
+        columns = ["label", "collection", "file_name", "count"]
 
-        # Sort and extract top 5 files per collection
-        top_files = (
-            grouped.groupby(["label", "collection"])
-            .apply(lambda x: x.nlargest(5, "count"))
-            .reset_index(drop=True)
+        # Extract the top N files per collection
+        records = [
+            {
+                "label": label,
+                "collection": collection,
+                "file_name": file_name,
+                "count": count,
+            }
+            for (label, collection), files in top_files.items()
+            for file_name, count in files
+        ]
+
+        # Keep the number of updates of every file, joined with the complexity
+        # of the files by the hotspots view
+        updates = [
+            {
+                "label": label,
+                "collection": collection,
+                "file_name": file_name,
+                "count": count,
+            }
+            for label, collection in top_files.groups()
+            for file_name, count in top_files.counts((label, collection)).items()
+        ]
+
+        return (
+            pd.DataFrame(records, columns=columns),
+            pd.DataFrame(updates, columns=columns),
         )
 
-        return top_files
+    @staticmethod
+    def _match_plugin_files(
+        entry: str, matcher: MultiPatternMatcher, plugin_files: Dict[str, str]
+    ) -> List[str]:
+        # Look for plugin names in the component prefix of the entry, entries
+        # without one are discarded. The prefix may be quoted or a path, e.g.
+        # ``ec2_vpc`` or inventory/aws_ec2, the matcher only reports whole
+        # names. Each file counts once per entry.
+        match = COMPONENT_PATTERN.match(entry)
+        if not match:
+            return []
+        prefix = match.group(1).replace("`", "")
+        files = {plugin_files[name] for name in matcher.find(prefix)}
+        return sorted(files)
 
     def _extract_changes_overtime(self):
         # Initialize a dictionary
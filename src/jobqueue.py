@@ -0,0 +1,298 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from scheduler import DONE, FAILED, PENDING, RUNNING, estimate_repo_sizes
+
+
+# Seconds a worker owns a job without renewing its lease
+DEFAULT_LEASE_SECONDS = 300
+# Attempts of a job whose workers keep dying before it is marked as failed
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_POLL_INTERVAL = 2.0
+# Seconds an idle worker waits for new jobs before exiting
+DEFAULT_IDLE_TIMEOUT = 60.0
+# Seconds after which the jobs of a run whose coordinator never removed them
+# (it died) are deleted
+STALE_RUN_SECONDS = 7 * 24 * 3600
+
+# Stored in the user_version of the queue file, a queue file with another
+# version is recreated
+SCHEMA_VERSION = 2
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    run TEXT NOT NULL,
+    name TEXT NOT NULL,
+    enqueued REAL NOT NULL,
+    collection TEXT NOT NULL,
+    args TEXT NOT NULL,
+    size_mb INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    started REAL,
+    duration REAL,
+    error TEXT,
+    result TEXT,
+    PRIMARY KEY (run, name)
+)
+"""
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# Queue of per-collection jobs kept in a SQLite file, so that workers on several
+# hosts sharing a filesystem can process the collections of a run without any
+# broker. Each run has its own id, so several runs can share a queue file. A
+# worker claims a job by taking a lease on it and renews the lease while it
+# works, a job whose lease expires (its worker died) is claimed again by
+# another worker. Results are stored as JSON in the same row as the job
+# status, so they are written atomically with it, and reading them never runs
+# code written to the shared file (tuples are read back as lists).
+class JobQueue:
+    def __init__(
+        self,
+        path: str,
+        lease_seconds: int = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.setLevel(logging.DEBUG)
+        with self._transaction() as db:
+            if db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                db.execute("DROP TABLE IF EXISTS jobs")
+                db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            db.execute(SCHEMA)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # A connection per transaction, so the queue can be used from several
+        # threads and processes. The default rollback journal is kept, WAL mode
+        # does not work on network filesystems.
+        db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def enqueue(self, collections: List[Dict], args: Dict) -> str:
+        # Add a run with one job per collection and return its id. The jobs of
+        # all the runs are claimed largest repositories first.
+        run = uuid.uuid4().hex
+        now = time.time()
+        sizes = estimate_repo_sizes(collections)
+        with self._transaction() as db:
+            db.execute(
+                "DELETE FROM jobs WHERE enqueued < ?", (now - STALE_RUN_SECONDS,)
+            )
+            db.executemany(
+                "INSERT INTO jobs (run, name, enqueued, collection, args, size_mb, "
+                "status) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        run,
+                        collection["name"],
+                        now,
+                        json.dumps(collection),
+                        json.dumps(args),
+                        size,
+                        PENDING,
+                    )
+                    for collection, size in zip(collections, sizes)
+                ],
+            )
+        self.logger.info(f"Enqueued {len(collections)} job(s) in {self.path}")
+        return run
+
+    def remove(self, run: str):
+        # Delete the jobs of a run once its results were read
+        with self._transaction() as db:
+            db.execute("DELETE FROM jobs WHERE run = ?", (run,))
+
+    def claim(self, worker: str) -> Optional[Tuple[str, str, Dict, Dict]]:
+        # Take the lease of the next pending job, or of a job whose lease has
+        # expired, and return (run, name, collection, args)
+        now = time.time()
+        with self._transaction() as db:
+            self._expire_leases(db, now)
+            row = db.execute(
+                "SELECT run, name, collection, args FROM jobs "
+                "WHERE status = ? OR (status = ? AND lease_until < ?) "
+                "ORDER BY size_mb DESC, enqueued, name LIMIT 1",
+                (PENDING, RUNNING, now),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET status = ?, worker = ?, lease_until = ?, "
+                "attempts = attempts + 1, started = ? WHERE run = ? AND name = ?",
+                (RUNNING, worker, now + self.lease_seconds, now, row[0], row[1]),
+            )
+        return row[0], row[1], json.loads(row[2]), json.loads(row[3])
+
+    def _expire_leases(self, db: sqlite3.Connection, now: float):
+        # Jobs whose workers died too many times are not retried
+        db.execute(
+            "UPDATE jobs SET status = ?, error = ? "
+            "WHERE status = ? AND lease_until < ? AND attempts >= ?",
+            (FAILED, "Lease expired", RUNNING, now, self.max_attempts),
+        )
+
+    def renew(self, run: str, name: str, worker: str) -> bool:
+        # False when the lease was lost, e.g. taken over after a long pause
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_until = ? "
+                "WHERE run = ? AND name = ? AND worker = ? AND status = ?",
+                (time.time() + self.lease_seconds, run, name, worker, RUNNING),
+            )
+        return cursor.rowcount == 1
+
+    def _finish(
+        self, run: str, name: str, worker: str, status: str, result=None, error=None
+    ) -> bool:
+        # Dates of the changelogs, if any were not quoted, are stored as text
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, "
+                "duration = ? - started, lease_until = NULL "
+                "WHERE run = ? AND name = ? AND worker = ? AND status = ?",
+                (
+                    status,
+                    None if result is None else json.dumps(result, default=str),
+                    error,
+                    time.time(),
+                    run,
+                    name,
+                    worker,
+                    RUNNING,
+                ),
+            )
+        if cursor.rowcount != 1:
+            self.logger.warning(f"Lease of {name} lost, discarding its result")
+        return cursor.rowcount == 1
+
+    def complete(self, run: str, name: str, worker: str, result) -> bool:
+        return self._finish(run, name, worker, DONE, result=result)
+
+    def fail(self, run: str, name: str, worker: str, error: str) -> bool:
+        return self._finish(run, name, worker, FAILED, error=error)
+
+    @contextmanager
+    def lease(self, run: str, name: str, worker: str) -> Iterator[None]:
+        # Renew the lease in the background while the job runs
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(self.lease_seconds / 3):
+                if not self.renew(run, name, worker):
+                    self.logger.warning(f"Lease of {name} lost")
+                    return
+
+        thread = threading.Thread(target=heartbeat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def unfinished(self) -> int:
+        with self._transaction() as db:
+            return db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)",
+                (PENDING, RUNNING),
+            ).fetchone()[0]
+
+    def wait(
+        self,
+        run: str,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        timeout: Optional[float] = None,
+    ) -> bool:
+        # Block until every job of the run is done or failed. The jobs left are failed, and
+        # False returned, after timeout seconds or once no worker has held a
+        # live lease for lease_seconds, i.e. when every worker is gone: live
+        # workers claim pending jobs within seconds.
+        deadline = time.time() + timeout if timeout else None
+        idle_since = time.time()
+        remaining = None
+        while True:
+            now = time.time()
+            with self._transaction() as db:
+                self._expire_leases(db, now)
+                unfinished, leased = db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(lease_until >= ?), 0) FROM jobs "
+                    "WHERE run = ? AND status IN (?, ?)",
+                    (now, run, PENDING, RUNNING),
+                ).fetchone()
+            if unfinished != remaining:
+                remaining = unfinished
+                self.logger.info(f"{remaining} job(s) left in {self.path}")
+            if not remaining:
+                return True
+
+            if leased:
+                idle_since = now
+            if deadline is not None and now > deadline:
+                error = f"Timed out after {timeout}s"
+            elif now - idle_since > self.lease_seconds:
+                error = f"No live worker for {self.lease_seconds}s"
+            else:
+                time.sleep(poll_interval)
+                continue
+
+            with self._transaction() as db:
+                db.execute(
+                    "UPDATE jobs SET status = ?, error = ?, lease_until = NULL "
+                    "WHERE run = ? AND status IN (?, ?)",
+                    (FAILED, error, run, PENDING, RUNNING),
+                )
+            self.logger.error(f"{error}, {remaining} job(s) of {self.path} failed")
+            return False
+
+    def results(self, run: str) -> Dict[str, object]:
+        # Result of every completed job of the run by collection name
+        with self._transaction() as db:
+            rows = db.execute(
+                "SELECT name, result FROM jobs WHERE run = ? AND status = ?",
+                (run, DONE),
+            ).fetchall()
+        return {name: json.loads(result) for name, result in rows}
+
+    def log_status(self, run: str):
+        # Per-job status summary, as Scheduler.log_status
+        with self._transaction() as db:
+            rows = db.execute(
+                "SELECT name, status, size_mb, duration, worker, error FROM jobs "
+                "WHERE run = ? ORDER BY size_mb DESC, name",
+                (run,),
+            ).fetchall()
+        for name, status, size_mb, duration, worker, error in rows:
+            duration = f"{duration:.1f}s" if duration is not None else "-"
+            self.logger.info(
+                f"{name:<45} {status:<8} {size_mb:>6} MB {duration:>8}  {worker or '-'}"
+                + (f"  {error}" if error else "")
+            )
+        failed = [row[0] for row in rows if row[1] == FAILED]
+        if failed:
+            self.logger.warning(f"{len(failed)} collection(s) failed: {failed}")
@@ -1,23 +1,58 @@
 import os
-import git
+import sys
 import argparse
 import logging
 import shutil
 import subprocess
 import tempfile
+import time
 from collections import defaultdict
-from typing import Dict, List
+from typing import Dict, List, Optional
 from packaging.version import parse as parse_version
 import yaml
 
-from insights import InsightsGenerator
-from stats import CodeQualityAnalyzer
-from plotter import Plotter
+from stats import CodeQualityAnalyzer, is_ignored_dir
+from churn import ChurnAnalyzer
+from repository import GitRepository, tags_fingerprint
+from scheduler import (
+    DEFAULT_MAX_CONCURRENT_CLONES,
+    Scheduler,
+    clone_slot,
+    describe_error,
+)
+from jobqueue import (
+    DEFAULT_IDLE_TIMEOUT,
+    DEFAULT_LEASE_SECONDS,
+    DEFAULT_POLL_INTERVAL,
+    JobQueue,
+    worker_id,
+)
+from snapshot import DEFAULT_SNAPSHOT_FILE, SnapshotError, write_snapshot
+from topn import DEFAULT_TOP_N
+from watch import DEFAULT_WATCH_INTERVAL, Watcher
+
+# pandas (insights) and dash/plotly (plotter) are imported lazily by the
+# commands that need them, so that the collection path starts quickly
+
+COMMANDS = ("collect", "report", "serve", "run", "worker", "watch")
+
+# Retries of transient git failures, with exponential backoff (seconds)
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 2.0
+
+
+class ConfigError(Exception):
+    pass
 
 
 class ChangelogParser:
-    def __init__(self, collection_file: str):
+    def __init__(self, collection_file: str, queue: Optional[str] = None):
         self.collection_file = collection_file
+        # Job queue file shared with `main.py worker` processes, when the
+        # collections are not processed by this host only
+        self.queue = queue
+        self.retries = DEFAULT_RETRIES
+        self.backoff = DEFAULT_BACKOFF
         self.logger = logging.getLogger(self.__class__.__name__)
         self.logger.setLevel(logging.DEBUG)
 
@@ -26,50 +61,43 @@ class ChangelogParser:
             collections = yaml.safe_load(file)
         return collections
 
-    def load_changelog(self, collection: Dict, limit=None) -> Dict:
+    def select_tags(self, collection: Dict, tags: List[str], limit=None) -> List[str]:
+        # Tags of the analysed window: the latest `limit` ones, or those from
+        # min_tag on
+        if limit:
+            return tags[-limit:]
+        if collection.get("min_tag"):
+            return [
+                tag
+                for tag in tags
+                if parse_version(tag) >= parse_version(collection["min_tag"])
+            ]
+        return tags
+
+    def load_changelog(self, collection: Dict, repo: GitRepository, limit=None) -> Dict:
         changelog = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
-        temp_dir = tempfile.mkdtemp(prefix=f'{collection["name"]}_repo_')
+        tags = []
 
         try:
-            repo_path = os.path.join(temp_dir, collection["name"])
-
-            # Clone repository if it doesn't exist
-            if not os.path.exists(repo_path):
-                subprocess.run(["git", "clone", collection["github_repo"], repo_path])
+            tags = repo.tags()
 
-            repo = git.Repo(repo_path)
-            tags = repo.git.tag(sort="creatordate").split("\n")
-
-            if len(tags) == 1 and tags[0] == "":
+            if not tags:
                 self.logger.info(
                     f'Collection {collection["name"]} does not have GitHub tags'
                 )
                 return changelog
 
-            if limit:
-                tags = tags[-limit:]
-
-            elif collection.get("min_tag"):
-                tags = [
-                    tag
-                    for tag in tags
-                    if parse_version(tag) >= parse_version(collection["min_tag"])
-                ]
+            tags = self.select_tags(collection, tags, limit)
 
-            # Checkout to the specific tag
-            subprocess.run(["git", "checkout", tags[-1]], cwd=repo_path)
-
-            # Check for the existence of changelog files
-            changelog_dir = os.path.join(repo_path, "changelogs")
+            # Check for the existence of changelog files at the specific tag
             changelog_files = ["changelog.yml", "changelog.yaml"]
             changelog_found = False
 
             for changelog_file in changelog_files:
-                changelog_path = os.path.join(changelog_dir, changelog_file)
-                if os.path.exists(changelog_path):
-                    with open(changelog_path, "r") as file:
-                        changelog_content = yaml.safe_load(file)
-                        changelog[collection["name"]] = changelog_content["releases"]
+                content = repo.read_blob(f"{tags[-1]}:changelogs/{changelog_file}")
+                if content is not None:
+                    changelog_content = yaml.safe_load(str(content, "utf-8"))
+                    changelog[collection["name"]] = changelog_content["releases"]
                     changelog_found = True
                     break  # Stop searching if we've found and loaded the changelog
 
@@ -81,18 +109,20 @@ class ChangelogParser:
             )
         except Exception as e:
             self.logger.error(f"An unexpected error occurred: {e}")
-        finally:
-            if temp_dir:
-                shutil.rmtree(temp_dir)  # Delete temporary directory
 
         return changelog
 
-    def _generate_code_quality_stats(self, collection: Dict, limit=None) -> Dict:
+    def _generate_code_quality_stats(
+        self, collection: Dict, repo: GitRepository, limit=None, top_n=DEFAULT_TOP_N
+    ) -> Dict:
         # Initialize CodeQualityAnalyzer for current collection
 
         def is_empty_dict_or_list(value):
-            # Check if the value is an empty dictionary or list, or if it is zero
-            if isinstance(value, dict) or isinstance(value, list):
+            # Check if the value is an empty list, or a dictionary of empty
+            # values (e.g. raw metrics that are all zero)
+            if isinstance(value, dict):
+                return contains_only_empty_values(value)
+            if isinstance(value, list):
                 return not bool(value)
             return False
 
@@ -100,71 +130,449 @@ class ChangelogParser:
             # Check that all values in the dictionary are either empty dictionaries/lists or zero values
             return all(is_empty_dict_or_list(v) or v == 0 for v in d.values())
 
-        analyzer = CodeQualityAnalyzer(collection, limit)
+        analyzer = CodeQualityAnalyzer(collection, repo, top_n)
         result = analyzer.analyze_collections()
         return (
             {collection["name"]: result}
-            if not contains_only_empty_values(result)
+            if result and not contains_only_empty_values(result)
             else {}
         )
 
-    def parse(self):
+    def _generate_churn(
+        self, collection: Dict, repo: GitRepository, limit=None, top_n=DEFAULT_TOP_N
+    ) -> Dict:
+        tags = self.select_tags(collection, repo.tags(), limit)
+        try:
+            return ChurnAnalyzer(collection, repo, tags, top_n).analyze()
+        except Exception as e:
+            self.logger.error(
+                f"Unable to compute the churn of {collection['name']}: {e}"
+            )
+            return {}
+
+    def load_plugin_files(self, repo: GitRepository, tag: str) -> Dict:
+        # Map the name of every Python plugin and module to its file, e.g.
+        # ec2_instance -> plugins/modules/ec2_instance.py
+        plugin_files: Dict = {}
+        for path, _ in repo.walk(tag, skip_dir=is_ignored_dir, folder="plugins"):
+            name, extension = os.path.splitext(path.rsplit("/", 1)[-1])
+            if extension != ".py" or name.startswith((".", "_")):
+                continue
+            # Modules win over the action plugins sharing their name
+            if name not in plugin_files or path.startswith("plugins/modules/"):
+                plugin_files[name] = path
+        return plugin_files
+
+    def process_collection(
+        self, collection: Dict, limit=None, top_n=DEFAULT_TOP_N
+    ) -> Dict:
+        # Clone the collection once and share it between changelog loading and
+        # code quality analysis
+        changelog: Dict = {}
+        stats: Dict = {}
+        plugin_files: Dict = {}
+        tag = None
+        tag_refs = None
+        temp_dir = tempfile.mkdtemp(prefix=f'{collection["name"]}_repo_')
+
+        try:
+            repo_path = os.path.join(temp_dir, collection["name"])
+            repo = GitRepository.clone(
+                collection["github_repo"],
+                repo_path,
+                retries=self.retries,
+                backoff=self.backoff,
+                slot=clone_slot,
+            )
+            with repo:
+                # Fetch the changelog based on tags and min_tag
+                changelog = self.load_changelog(collection, repo, limit)
+                tag = repo.tags()[-1] if repo.tags() else None
+                tag_refs = tags_fingerprint(repo.tag_refs())
+                if changelog:
+                    plugin_files = self.load_plugin_files(repo, tag)
+                    stats = self._generate_code_quality_stats(
+                        collection, repo, limit, top_n
+                    )
+                    if stats:
+                        stats[collection["name"]]["churn"] = self._generate_churn(
+                            collection, repo, limit, top_n
+                        )
+        finally:
+            shutil.rmtree(temp_dir)  # Delete temporary directory
+
+        return {
+            "changelog": dict(changelog),
+            "stats": stats,
+            "tag": tag,
+            "tag_refs": tag_refs,
+            "plugin_files": plugin_files,
+        }
+
+    def analyze(self) -> Optional[Dict]:
+        return self.merge_results(self.process_collections())
+
+    def _settings(self, collections: Dict):
+        # limit and top_n of the configuration, retries are kept on the parser
+        scheduler_config = collections.get("scheduler", {})
+        self.retries = scheduler_config.get("retries", DEFAULT_RETRIES)
+        self.backoff = scheduler_config.get("backoff", DEFAULT_BACKOFF)
+        top_n = collections.get("top_n", DEFAULT_TOP_N)
+        if isinstance(top_n, bool) or not isinstance(top_n, int) or top_n < 1:
+            raise ConfigError(
+                f"top_n must be a positive integer in {self.collection_file}, "
+                f"got {top_n!r}"
+            )
+        return collections.get("limit") or None, top_n
+
+    def process_collections(
+        self, names: Optional[List[str]] = None, queue_timeout=None
+    ) -> Dict:
+        # Process the collections of the configuration, or only the named ones,
+        # and return their results by collection name. Queued jobs not done
+        # within queue_timeout seconds, if any, are failed.
+        collections = self.load_collections_from_yaml()
+        limit, top_n = self._settings(collections)
+        selected = [
+            collection
+            for collection in collections["collections"]
+            if names is None or collection["name"] in names
+        ]
+
+        # Collections complete in any order, keep their results by name
+        if self.queue:
+            return self._run_queue(selected, limit, top_n, queue_timeout)
+        return self._run_scheduler(
+            selected, collections.get("scheduler", {}), limit, top_n
+        )
+
+    def merge_results(self, results: Dict) -> Optional[Dict]:
+        # Merge the results of the collections, in the configuration order, and
+        # generate the insights over all of them
         collections = self.load_collections_from_yaml()
+        limit, top_n = self._settings(collections)
         changelog_data = {}
         stats = {}
-        limit = None
-
-        if collections.get("limit"):
-            limit = collections["limit"]
+        tags = {}
+        tag_refs = {}
+        plugin_files = {}
 
         for collection in collections["collections"]:
-            self.logger.info(f"Collection: {collection['name']}")
             label = collection.get("label", "other")
             if not changelog_data.get(label):
                 changelog_data[label] = {}
             if not stats.get(label):
                 stats[label] = {}
 
-            # Fetch the changelog from the GitHub repository based on tags and min_tag
-            result = self.load_changelog(collection, limit)
-            if not result:
+            if collection["name"] not in results:
+                continue
+            result = results[collection["name"]]
+            tags[collection["name"]] = result["tag"]
+            tag_refs[collection["name"]] = result["tag_refs"]
+            if not result["changelog"]:
                 self.logger.info(
                     f"No changelog available for collection: {collection['name']}. Skipping..."
                 )
                 continue
 
-            changelog_data[label].update(result)
-            result_stats = self._generate_code_quality_stats(collection, limit)
-            if result_stats:
-                stats[label].update(result_stats)
+            changelog_data[label].update(result["changelog"])
+            if result["stats"]:
+                stats[label].update(result["stats"])
+            if result["plugin_files"]:
+                plugin_files[collection["name"]] = result["plugin_files"]
 
-        if changelog_data:
-            self.logger.info("Initialize and run InsightsGenerator")
-            data_extractor = InsightsGenerator(changelog_data, limit)
-            self.plot(data_extractor.counts, stats)
-        else:
+        # The labels are added up front, check that any collection has data
+        if not any(changelog_data.values()):
             self.logger.warning("No changelog data found for any collections.")
+            return None
+
+        self.logger.info("Initialize and run InsightsGenerator")
+        from insights import InsightsGenerator
+
+        data_extractor = InsightsGenerator(
+            changelog_data, limit, top_n, plugin_files=plugin_files
+        )
+        return {
+            "counts": data_extractor.counts,
+            "stats": stats,
+            "top_n": top_n,
+            "tags": tags,
+            "tag_refs": tag_refs,
+        }
 
-    def plot(self, counts, stats):
+    def _run_scheduler(
+        self, collections: List, scheduler_config: Dict, limit, top_n
+    ) -> Dict:
+        scheduler = Scheduler(
+            collections,
+            workers=scheduler_config.get("workers"),
+            max_disk_mb=scheduler_config.get("max_disk_mb"),
+            max_concurrent_clones=scheduler_config.get(
+                "max_concurrent_clones", DEFAULT_MAX_CONCURRENT_CLONES
+            ),
+        )
+        results = {}
+        for job, result in scheduler.run(self.process_collection, limit, top_n):
+            if result is not None:
+                results[job.name] = result
+        return results
+
+    def _run_queue(self, collections: List, limit, top_n, timeout=None) -> Dict:
+        # Enqueue a job per collection and wait for the workers to process them
+        queue = JobQueue(self.queue)
+        run = queue.enqueue(
+            collections,
+            {
+                "limit": limit,
+                "top_n": top_n,
+                "retries": self.retries,
+                "backoff": self.backoff,
+            },
+        )
+        try:
+            queue.wait(run, timeout=timeout)
+            queue.log_status(run)
+            return queue.results(run)
+        finally:
+            queue.remove(run)
+
+    def collect(self, output: str = DEFAULT_SNAPSHOT_FILE) -> Optional[Dict]:
+        results = self.analyze()
+        if not results:
+            return None
+        write_snapshot(output, **results)
+        self.logger.info(f"Snapshot saved to {output}")
+        return results
+
+    def parse(self, snapshot_file: str = DEFAULT_SNAPSHOT_FILE):
+        results = self.collect(snapshot_file)
+        if results:
+            self.plot(results["counts"], results["stats"], results["top_n"])
+
+    def plot(self, counts, stats, top_n=DEFAULT_TOP_N):
         # Create and run the plotter
         self.logger.info("Initialize and run Plotter")
-        plotter = Plotter(counts, stats)
+        from plotter import Plotter
+
+        plotter = Plotter(counts, stats, top_n)
         plotter.run()
 
 
-if __name__ == "__main__":
+def work(
+    queue_file: str,
+    lease_seconds: int = DEFAULT_LEASE_SECONDS,
+    idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+):
+    # Process jobs of the queue until it stays empty for idle_timeout seconds
+    logger = logging.getLogger("worker")
+    queue = JobQueue(queue_file, lease_seconds=lease_seconds)
+    worker = worker_id()
+    idle_since = time.time()
+    while True:
+        job = queue.claim(worker)
+        if job is None:
+            if not queue.unfinished() and time.time() - idle_since > idle_timeout:
+                logger.info(f"No job left in {queue_file}, exiting")
+                return
+            time.sleep(poll_interval)
+            continue
+
+        run, name, collection, args = job
+        logger.info(f"Worker {worker} processing {name}")
+        changelog_parser = ChangelogParser(None)
+        changelog_parser.retries = args["retries"]
+        changelog_parser.backoff = args["backoff"]
+        with queue.lease(run, name, worker):
+            try:
+                result = changelog_parser.process_collection(
+                    collection, args["limit"], args["top_n"]
+                )
+            except Exception as e:
+                logger.error(f"Failed {name}: {describe_error(e)}")
+                queue.fail(run, name, worker, describe_error(e))
+            else:
+                queue.complete(run, name, worker, result)
+        idle_since = time.time()
+
+
+def report(snapshot_file: str):
+    # Save every figure in the saved_graphs folder without starting the server
+    from plotter import Plotter
+
+    plotter = Plotter.from_snapshot(snapshot_file)
+    plotter.report()
+
+
+def serve(snapshot_file: str, host: str, port: int):
+    from plotter import Plotter
+
+    plotter = Plotter.from_snapshot(snapshot_file)
+    plotter.run(host=host, port=port)
+
+
+def watch(
+    changelog_parser: ChangelogParser,
+    snapshot_file: str,
+    interval: int,
+    host: str,
+    port: int,
+) -> bool:
+    plotter = Watcher(changelog_parser, snapshot_file, interval).start()
+    if plotter is None:
+        return False
+    # The reloader would start a second watcher in its child process
+    plotter.run(host=host, port=port, use_reloader=False)
+    return True
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Parse chnagelog.yml files")
-    parser.add_argument(
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    collect_parser = subparsers.add_parser(
+        "collect", help="Analyze the collections and save the results."
+    )
+    collect_parser.add_argument(
+        "collections",
+        type=str,
+        help="The config file containing the list of collections.",
+    )
+    collect_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=DEFAULT_SNAPSHOT_FILE,
+        help="The snapshot file the results are saved to.",
+    )
+    collect_parser.add_argument(
+        "--queue",
+        type=str,
+        help="Job queue file shared with `worker` processes, on several hosts.",
+    )
+
+    report_parser = subparsers.add_parser(
+        "report", help="Save the figures of previously collected results."
+    )
+    report_parser.add_argument(
+        "snapshot", type=str, help="The snapshot file created by collect."
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Start the dashboard for previously collected results."
+    )
+    serve_parser.add_argument(
+        "snapshot", type=str, help="The snapshot file created by collect."
+    )
+    serve_parser.add_argument("--host", type=str, default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8050)
+
+    run_parser = subparsers.add_parser(
+        "run", help="Analyze the collections and start the dashboard."
+    )
+    run_parser.add_argument(
         "collections",
         type=str,
         help="The config file containing the list of collections.",
     )
-    args = parser.parse_args()
+    run_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=DEFAULT_SNAPSHOT_FILE,
+        help="The snapshot file the results are saved to.",
+    )
+    run_parser.add_argument(
+        "--queue",
+        type=str,
+        help="Job queue file shared with `worker` processes, on several hosts.",
+    )
+
+    worker_parser = subparsers.add_parser(
+        "worker", help="Process the collections enqueued by collect --queue."
+    )
+    worker_parser.add_argument(
+        "queue", type=str, help="The job queue file shared with collect."
+    )
+    worker_parser.add_argument(
+        "--lease",
+        type=int,
+        default=DEFAULT_LEASE_SECONDS,
+        help="Seconds after which the job of a dead worker is processed again.",
+    )
+    worker_parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=DEFAULT_IDLE_TIMEOUT,
+        help="Seconds to wait for new jobs once the queue is empty.",
+    )
+
+    watch_parser = subparsers.add_parser(
+        "watch",
+        help="Start the dashboard and refresh it when collections are tagged.",
+    )
+    watch_parser.add_argument(
+        "collections",
+        type=str,
+        help="The config file containing the list of collections.",
+    )
+    watch_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=DEFAULT_SNAPSHOT_FILE,
+        help="The snapshot file the results are saved to after each refresh.",
+    )
+    watch_parser.add_argument(
+        "--interval",
+        type=int,
+        default=DEFAULT_WATCH_INTERVAL,
+        help="Seconds between two checks for new tags.",
+    )
+    watch_parser.add_argument("--host", type=str, default="127.0.0.1")
+    watch_parser.add_argument("--port", type=int, default=8050)
+    watch_parser.add_argument(
+        "--queue",
+        type=str,
+        help="Job queue file shared with `worker` processes, on several hosts.",
+    )
+
+    # `main.py collections.yml` keeps working as a shortcut for `run`
+    if argv and argv[0] not in COMMANDS and not argv[0].startswith("-"):
+        argv = ["run", *argv]
+
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
 
     # Configure logging
     logging.basicConfig(
         level=logging.DEBUG,
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     )
-    changelog_parser = ChangelogParser(args.collections)
-    changelog_parser.parse()
+
+    try:
+        if args.command == "collect":
+            changelog_parser = ChangelogParser(args.collections, queue=args.queue)
+            if not changelog_parser.collect(args.output):
+                sys.exit(1)
+        elif args.command == "worker":
+            work(args.queue, lease_seconds=args.lease, idle_timeout=args.idle_timeout)
+        elif args.command == "watch":
+            changelog_parser = ChangelogParser(args.collections, queue=args.queue)
+            if not watch(
+                changelog_parser, args.output, args.interval, args.host, args.port
+            ):
+                sys.exit(1)
+        elif args.command == "report":
+            report(args.snapshot)
+        elif args.command == "serve":
+            serve(args.snapshot, args.host, args.port)
+        else:
+            changelog_parser = ChangelogParser(args.collections, queue=args.queue)
+            changelog_parser.parse(args.output)
+    except (ConfigError, SnapshotError) as e:
+        logging.getLogger("main").error(e)
+        sys.exit(1)
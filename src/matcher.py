@@ -0,0 +1,70 @@
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+# Aho-Corasick automaton matching many names at once. Building it is linear in
+# the total length of the names and scanning a text is linear in its length,
+# whatever the number of names. Only whole words are reported, so "ec2_vpc"
+# does not match inside "ec2_vpc_route_table".
+class MultiPatternMatcher:
+    def __init__(self, patterns: Iterable[str]):
+        # Node 0 is the root, each node has its transitions, failure link and
+        # the patterns ending there (including those reached by failure links)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+
+        for pattern in set(patterns):
+            if pattern:
+                self._insert(pattern.lower())
+        self._build_failure_links()
+
+    def _insert(self, pattern: str):
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append(pattern)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, next_node in self._goto[node].items():
+                queue.append(next_node)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_node] = self._goto[fail].get(char, 0)
+                if self._fail[next_node] == next_node:
+                    self._fail[next_node] = 0
+                self._output[next_node] += self._output[self._fail[next_node]]
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, str]]:
+        # Yield (start, pattern) for every whole-word occurrence in text
+        text = text.lower()
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for pattern in self._output[node]:
+                start = position - len(pattern) + 1
+                end = position + 1
+                if (start == 0 or not _is_word_char(text[start - 1])) and (
+                    end == len(text) or not _is_word_char(text[end])
+                ):
+                    yield start, pattern
+
+    def find(self, text: str) -> Set[str]:
+        return {pattern for _, pattern in self.finditer(text)}
@@ -1,22 +1,141 @@
+import gzip
+import logging
+import math
 import os
-from typing import Dict
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
 import dash
-import dash_core_components as dcc
-import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash import ALL, Input, Output, Patch, State, dcc, html
+from dash.exceptions import PreventUpdate
 import plotly.io as pio
 import plotly.express as px
+import plotly.graph_objects as go
+import pandas as pd
+
+from insights import DEFAULT_TIME_BUCKET, TIME_BUCKETS
+from snapshot import read_snapshot
+from topn import DEFAULT_TOP_N
+
+
+# Number of matching entries listed below the search box
+MAX_SEARCH_RESULTS = 50
+
+# Views whose figures depend on the selected time bucket
+BUCKETED_VIEWS = (
+    "changes-collection",
+    "changes-overtime-collection",
+    "modules-overtime-label",
+    "changes-trend-label",
+)
+# Views with a figure per collection, shown PAGE_SIZE collections at a time
+PAGED_VIEWS = (
+    "changes-collection",
+    "changes-overtime-collection",
+    "top-files",
+    "top-complex-files",
+    "top-churn-files",
+    "churn-releases",
+)
+PAGE_SIZE = 6
+BUCKET_TITLES = {
+    "release": "Release Date",
+    "week": "Week",
+    "month": "Month",
+    "quarter": "Quarter",
+}
 
 
 class Plotter:
-    def __init__(self, counts, stats: Dict):
-        self.counts = counts
-        self.stats = stats
-        self.app = dash.Dash(__name__)
+    def __init__(
+        self,
+        counts,
+        stats: Dict,
+        top_n: int = DEFAULT_TOP_N,
+        refresh_interval: Optional[int] = None,
+    ):
+        self.top_n = top_n
+        # Seconds between two checks of open browsers for updated data, see
+        # update()
+        self.refresh_interval = refresh_interval
+        # Figures are only exported to saved_graphs by report(), serving a
+        # view never waits for the image export
+        self.save = False
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.setLevel(logging.DEBUG)
+        self._local = threading.local()
+        self._data = self._view_data(counts, stats, version=0)
+        # Responses are gzip compressed through flask-compress
+        self.app = dash.Dash(__name__, compress=True)
         self._setup_layout()
         self._setup_callbacks()
 
+    @staticmethod
+    def _view_data(counts, stats: Dict, version: int) -> Dict:
+        return {
+            "counts": counts,
+            "stats": stats,
+            "labels": Plotter._collection_labels(counts, stats),
+            # Serialized figures of the views already built, sent as they are
+            "payloads": {},
+            # Serialized figures of the paged views by (plot type, bucket,
+            # collection), shared by all the pages and filters showing them
+            "figures": {},
+            "version": version,
+        }
+
+    def update(self, counts, stats: Dict):
+        # Swap the data shown by the dashboard at once. Requests in flight keep
+        # the data they started with, and open browsers drop their cached views
+        # when they next see the new version
+        self._data = self._view_data(counts, stats, self._data["version"] + 1)
+        self.logger.info(f"Dashboard data updated to version {self.version}")
+
+    @contextmanager
+    def _pinned(self) -> Iterator[None]:
+        # Keep the data of the current request, even if update() swaps it
+        self._local.data = self._data
+        try:
+            yield
+        finally:
+            self._local.data = None
+
+    def _current(self) -> Dict:
+        return getattr(self._local, "data", None) or self._data
+
+    @property
+    def counts(self):
+        return self._current()["counts"]
+
+    @property
+    def stats(self) -> Dict:
+        return self._current()["stats"]
+
+    @property
+    def version(self) -> int:
+        return self._current()["version"]
+
+    @property
+    def _labels(self) -> Dict[str, str]:
+        return self._current()["labels"]
+
+    @property
+    def _payloads(self) -> Dict:
+        return self._current()["payloads"]
+
+    @property
+    def _figures(self) -> Dict[Tuple[str, str, str], str]:
+        return self._current()["figures"]
+
+    @classmethod
+    def from_snapshot(cls, path: str) -> "Plotter":
+        # Start the dashboard from a snapshot written by ChangelogParser
+        results = read_snapshot(path)
+        return cls(results["counts"], results["stats"], results["top_n"])
+
     def save_figure(self, fig, filename):
+        if not self.save:
+            return
         output_dir = "saved_graphs"
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
@@ -26,6 +145,17 @@ class Plotter:
         # Main layout components
         self.app.layout = html.Div(
             [
+                html.H3("Search Changelogs"),
+                dcc.Input(
+                    id="search-query",
+                    type="search",
+                    placeholder="e.g. imdsv2 boto3",
+                    debounce=True,
+                    style={"width": "50%"},
+                ),
+                html.Div(id="search-summary"),
+                dcc.Graph(id="search-hits", style={"display": "none"}),
+                html.Div(id="search-results"),
                 html.H3("Select Plot Type"),
                 dcc.Dropdown(
                     id="plot-type-dropdown",
@@ -36,7 +166,7 @@ class Plotter:
                             "value": "changes-collection",
                         },
                         {
-                            "label": "Top 5 Most Updated Files by Collection",
+                            "label": f"Top {self.top_n} Most Updated Files by Collection",
                             "value": "top-files",
                         },
                         {"label": "Total Releases by Label", "value": "releases-label"},
@@ -49,9 +179,29 @@ class Plotter:
                             "value": "avg-complexity",
                         },
                         {
-                            "label": "Top 5 Most Complex Files by Collection",
+                            "label": "Avg. Maintainability Index by Collection",
+                            "value": "maintainability-index",
+                        },
+                        {
+                            "label": "Lines of Code by Collection",
+                            "value": "raw-metrics",
+                        },
+                        {
+                            "label": f"Top {self.top_n} Most Complex Files by Collection",
                             "value": "top-complex-files",
                         },
+                        {
+                            "label": "Churn x Complexity Hotspots",
+                            "value": "hotspots",
+                        },
+                        {
+                            "label": f"Top {self.top_n} Most Churned Files by Collection",
+                            "value": "top-churn-files",
+                        },
+                        {
+                            "label": "Churn per Release by Collection",
+                            "value": "churn-releases",
+                        },
                         {
                             "label": "New Modules Over Time by Label",
                             "value": "modules-overtime-label",
@@ -60,87 +210,475 @@ class Plotter:
                             "label": "Changes Over Time by Collection",
                             "value": "changes-overtime-collection",
                         },
+                        {
+                            "label": "Changes Trend by Label",
+                            "value": "changes-trend-label",
+                        },
                     ],
                     value="changes-label",
                 ),
+                html.H3("Time Bucket"),
+                dcc.RadioItems(
+                    id="time-bucket",
+                    options=[
+                        {"label": BUCKET_TITLES[bucket], "value": bucket}
+                        for bucket in TIME_BUCKETS
+                    ],
+                    value=DEFAULT_TIME_BUCKET,
+                    inline=True,
+                ),
+                html.H3("Filter Collections"),
+                html.Div(
+                    [
+                        dcc.Dropdown(
+                            id="label-filter",
+                            options=sorted(set(self._labels.values())),
+                            placeholder="All labels",
+                            style={"width": "300px"},
+                        ),
+                        dcc.Dropdown(
+                            id="collection-filter",
+                            options=sorted(self._labels),
+                            placeholder="All collections",
+                            style={"width": "300px"},
+                        ),
+                    ],
+                    style={"display": "flex", "gap": "10px"},
+                ),
+                dcc.Store(id="bucketed-views", data=list(BUCKETED_VIEWS)),
+                dcc.Store(id="paged-views", data=list(PAGED_VIEWS)),
+                dcc.Store(id="view-page", data=0),
+                dcc.Store(id="view-key"),
+                # Version of the data the cached figures were built from, checked
+                # every refresh_interval seconds
+                dcc.Store(id="data-version", data=self.version),
+                dcc.Interval(
+                    id="refresh",
+                    interval=(self.refresh_interval or 60) * 1000,
+                    disabled=not self.refresh_interval,
+                ),
+                # Serialized figures of the views loaded so far, filled one view
+                # at a time so that switching back to a view needs no request
+                dcc.Store(id="figure-cache", data={}),
+                # The template is the largest part of a figure, it is sent once
+                # here and stripped from the figures
+                dcc.Store(
+                    id="figure-template",
+                    data=pio.templates[pio.templates.default].to_plotly_json(),
+                ),
+                dcc.Store(id="requested-view"),
+                html.H1(id="view-title"),
                 html.Div(
-                    id="graph-container"
-                ),  # Container for dynamic graph components
+                    [
+                        html.Button("Previous", id="previous-page"),
+                        html.Span(id="page-info", style={"margin": "0 10px"}),
+                        html.Button("Next", id="next-page"),
+                    ],
+                    id="pager",
+                    style={"display": "none"},
+                ),
+                # Graphs are created once and only their figures are replaced,
+                # views never show more than a page of figures
+                html.Div(
+                    [
+                        dcc.Graph(
+                            id={"type": "graph-slot", "index": i},
+                            style={"display": "none"},
+                        )
+                        for i in range(PAGE_SIZE)
+                    ],
+                    id="graph-container",
+                ),
+            ]
+        )
+
+    @staticmethod
+    def _collection_labels(counts, stats: Dict) -> Dict[str, str]:
+        # Label of every collection, for the filters
+        changes = counts["changes_overtime"]
+        labels = dict(zip(changes["collection"], changes["label"]))
+        for label, collections in stats.items():
+            for collection in collections:
+                labels.setdefault(collection, label)
+        return labels
+
+    def _collection_stats(self) -> Dict:
+        # Code metrics of every collection, whatever its label
+        return {
+            collection: data
+            for collections in self.stats.values()
+            for collection, data in collections.items()
+        }
+
+    def _view_collections(
+        self, plot_type: str, bucket: str = DEFAULT_TIME_BUCKET
+    ) -> List[str]:
+        # Collections a paged view has a figure for, in display order
+        if plot_type in ("changes-collection", "changes-overtime-collection"):
+            return list(self.counts["changes_cube"].collections[bucket])
+        if plot_type == "top-files":
+            return list(self.counts["most_updated_files"]["collection"].unique())
+        if plot_type == "top-complex-files":
+            return [
+                collection
+                for collection, data in self._collection_stats().items()
+                if "complex_files" in data
+            ]
+        return list(self._churn())
+
+    def _views(self) -> Dict:
+        # Plot type selected in the drop-down menu and the method building it
+        return {
+            "changes-label": self._plot_changes_per_label,
+            "changes-collection": self._plot_changes_per_collection,
+            "top-files": self._plot_most_updated_files,
+            "releases-label": self._plot_releases_per_label,
+            "releases-collection": self._plot_releases_per_collection,
+            "top-complex-files": self._plot_most_complex_files,
+            "hotspots": self._plot_hotspots,
+            "top-churn-files": self._plot_most_churned_files,
+            "churn-releases": self._plot_churn_per_release,
+            "avg-complexity": self._plot_average_complexity,
+            "maintainability-index": self._plot_maintainability_index,
+            "raw-metrics": self._plot_raw_metrics,
+            "modules-overtime-label": self._plot_modules_overtime_per_label,
+            "changes-overtime-collection": self._plot_changes_overtime_per_collections,
+            "changes-trend-label": self._plot_changes_trend_per_label,
+        }
+
+    @staticmethod
+    def _serialize_figure(fig) -> str:
+        if not isinstance(fig, go.Figure):
+            fig = go.Figure(fig)
+        figure = fig.to_plotly_json()
+        figure["layout"].pop("template", None)
+        return pio.json.to_json_plotly(figure)
+
+    def _build_view(self, plot_type: str, bucket: str, **kwargs):
+        view = self._views()[plot_type]
+        return view(bucket, **kwargs) if bucket else view(**kwargs)
+
+    def _view_payload(self, view_key: str) -> Dict:
+        # Figures are serialized once with plotly's JSON encoder and sent as a
+        # single string, which the browser parses without Dash re-encoding them
+        if view_key not in self._payloads:
+            plot_type, bucket, page, label, collection = self._parse_view_key(view_key)
+            if plot_type in PAGED_VIEWS:
+                payload = self._page_payload(plot_type, bucket, page, label, collection)
+            else:
+                title, figures = self._build_view(plot_type, bucket)
+                figures = "[" + ",".join(map(self._serialize_figure, figures)) + "]"
+                payload = {"title": title, "figures": figures}
+            self._payloads[view_key] = payload
+            self.logger.debug(
+                f"View {view_key}: {len(payload['figures'])} bytes "
+                f"({len(gzip.compress(payload['figures'].encode()))} bytes compressed)"
+            )
+        return self._payloads[view_key]
+
+    def _page_payload(
+        self, plot_type: str, bucket: str, page: int, label: str, collection: str
+    ) -> Dict:
+        # Only the figures of the collections on the page are built, so the
+        # first page is as fast with a thousand collections as with ten
+        collections = [
+            name
+            for name in self._view_collections(plot_type, bucket or DEFAULT_TIME_BUCKET)
+            if (not label or self._labels.get(name) == label)
+            and (not collection or name == collection)
+        ]
+        pages = max(math.ceil(len(collections) / PAGE_SIZE), 1)
+        page = min(page, pages - 1)
+        visible = collections[page * PAGE_SIZE : (page + 1) * PAGE_SIZE]
+
+        missing = [
+            name for name in visible if (plot_type, bucket, name) not in self._figures
+        ]
+        title, figures = self._build_view(plot_type, bucket, collections=missing)
+        for name, figure in zip(missing, figures):
+            self._figures[(plot_type, bucket, name)] = self._serialize_figure(figure)
+
+        return {
+            "title": title,
+            "figures": "["
+            + ",".join(self._figures[(plot_type, bucket, name)] for name in visible)
+            + "]",
+            "page": page,
+            "pages": pages,
+            "total": len(collections),
+        }
+
+    def _parse_view_key(self, view_key) -> Optional[Tuple[str, str, int, str, str]]:
+        # Views are keyed by "<plot type>", "<plot type>|<bucket>" for the views
+        # depending on the time bucket, and
+        # "<plot type>|<bucket>|<page>|<label>|<collection>" for the paged ones,
+        # the bucket being empty for views not depending on it
+        if not isinstance(view_key, str):
+            return None
+        plot_type, *fields = view_key.split("|")
+        if plot_type not in self._views():
+            return None
+        bucket = fields[0] if fields else ""
+        if plot_type in BUCKETED_VIEWS:
+            if bucket not in TIME_BUCKETS:
+                return None
+        elif bucket:
+            return None
+        if plot_type not in PAGED_VIEWS:
+            return (plot_type, bucket, 0, "", "") if len(fields) <= 1 else None
+        if len(fields) != 4 or not fields[1].isdigit():
+            return None
+        return plot_type, bucket, int(fields[1]), fields[2], fields[3]
+
+    def _is_view_key(self, view_key) -> bool:
+        return self._parse_view_key(view_key) is not None
+
+    def _search(self, query: str):
+        index = self.counts["search_index"]
+        ids = index.search(query)
+
+        # Hit counts by month and label
+        hits = index.hits_over_time(ids)
+        fig = px.bar(
+            x=[month for month, _, _ in hits],
+            y=[count for _, _, count in hits],
+            color=[label for _, label, _ in hits],
+            title=f"Changelog Entries Matching '{query}' by Month",
+            labels={"x": "Month", "y": "Entries", "color": "Label"},
+        )
+
+        rows = [
+            html.Tr(
+                [
+                    html.Td(entry["collection"]),
+                    html.Td(entry["version"]),
+                    html.Td(entry["release_date"]),
+                    html.Td(entry["category"]),
+                    html.Td(entry["text"]),
+                ]
+            )
+            for entry in map(index.entry, ids[:MAX_SEARCH_RESULTS])
+        ]
+        table = html.Table(
+            [
+                html.Thead(
+                    html.Tr(
+                        [
+                            html.Th(column)
+                            for column in (
+                                "Collection",
+                                "Version",
+                                "Release Date",
+                                "Category",
+                                "Entry",
+                            )
+                        ]
+                    )
+                ),
+                html.Tbody(rows),
             ]
         )
 
+        summary = f"{len(ids)} matching entries"
+        if len(ids) > MAX_SEARCH_RESULTS:
+            summary += f", showing the {MAX_SEARCH_RESULTS} most recent"
+        return summary, fig, {} if ids else {"display": "none"}, table
+
     def _setup_callbacks(self):
         @self.app.callback(
-            Output("graph-container", "children"),
-            [Input("plot-type-dropdown", "value")],
+            Output("search-summary", "children"),
+            Output("search-hits", "figure"),
+            Output("search-hits", "style"),
+            Output("search-results", "children"),
+            Input("search-query", "value"),
+            prevent_initial_call=True,
         )
-        def update_graphs(plot_type: str):
-            if plot_type == "changes-label":
-                return self._plot_changes_per_label()
-            elif plot_type == "changes-collection":
-                return self._plot_changes_per_collection()
-            if plot_type == "top-files":
-                return self._plot_most_updated_files()
-            elif plot_type == "releases-label":
-                return self._plot_releases_per_label()
-            elif plot_type == "releases-collection":
-                return self._plot_releases_per_collection()
-            elif plot_type == "top-complex-files":
-                return self._plot_most_complex_files()
-            elif plot_type == "avg-complexity":
-                return self._plot_average_complexity()
-            elif plot_type == "modules-overtime-label":
-                return self._plot_modules_overtime_per_label()
-            elif plot_type == "changes-overtime-collection":
-                # Create the layout with a graph for each collection
-                return html.Div(
-                    [
-                        html.H1("Changes Over Time by Collection"),
-                        *[
-                            html.Div(
-                                [
-                                    dcc.Graph(
-                                        id=f"{collection_name}-graph",
-                                        figure=self._plot_changes_overtime_per_collection(
-                                            collection_name
-                                        ),
-                                    )
-                                ]
-                            )
-                            for collection_name in self.counts["changes_overtime"][
-                                "collection"
-                            ].unique()
-                        ],
-                    ]
+        def search(query: str):
+            if not query or not query.strip():
+                return "", {}, {"display": "none"}, None
+            with self._pinned():
+                return self._search(query.strip())
+
+        # Drop the views cached by the browser when the data has been updated,
+        # the selected view is then requested again
+        @self.app.callback(
+            Output("data-version", "data"),
+            Output("figure-cache", "data", allow_duplicate=True),
+            Output("label-filter", "options"),
+            Output("collection-filter", "options"),
+            Input("refresh", "n_intervals"),
+            State("data-version", "data"),
+            prevent_initial_call=True,
+        )
+        def refresh(_, version: int):
+            with self._pinned():
+                if self.version == version:
+                    raise PreventUpdate
+                return (
+                    self.version,
+                    {},
+                    sorted(set(self._labels.values())),
+                    sorted(self._labels),
                 )
-            else:
-                return html.Div("Select a plot type")
 
-    def _plot_changes_overtime_per_collection(self, collection_name):
-        df = self.counts["changes_overtime"]
+        # Another view or filter starts from the first page, the pager moves
+        # within the pages of the current view
+        self.app.clientside_callback(
+            """
+            function(previous, next, plotType, bucket, label, collection,
+                     page, key, cache) {
+                const noUpdate = window.dash_clientside.no_update;
+                const triggered = window.dash_clientside.callback_context.triggered
+                    .map((trigger) => trigger.prop_id);
+                const view = key && cache ? cache[key] : undefined;
+                let newPage = 0;
+                if (triggered.includes("previous-page.n_clicks")) {
+                    newPage = Math.max(page - 1, 0);
+                } else if (triggered.includes("next-page.n_clicks")) {
+                    newPage = view && page + 1 < view.pages ? page + 1 : page;
+                }
+                return newPage === page ? noUpdate : newPage;
+            }
+            """,
+            Output("view-page", "data"),
+            Input("previous-page", "n_clicks"),
+            Input("next-page", "n_clicks"),
+            Input("plot-type-dropdown", "value"),
+            Input("time-bucket", "value"),
+            Input("label-filter", "value"),
+            Input("collection-filter", "value"),
+            State("view-page", "data"),
+            State("view-key", "data"),
+            State("figure-cache", "data"),
+        )
 
-        # Filter the DataFrame for the specific collection
-        collection_df = df[df["collection"] == collection_name]
+        # Key of the selected view, see _parse_view_key
+        self.app.clientside_callback(
+            """
+            function(plotType, bucket, page, label, collection, bucketed, paged) {
+                if (!plotType) {
+                    return null;
+                }
+                const fields = [plotType];
+                if (bucketed.includes(plotType) || paged.includes(plotType)) {
+                    fields.push(bucketed.includes(plotType) ? bucket : "");
+                }
+                if (paged.includes(plotType)) {
+                    fields.push(page, label || "", collection || "");
+                }
+                return fields.join("|");
+            }
+            """,
+            Output("view-key", "data"),
+            Input("plot-type-dropdown", "value"),
+            Input("time-bucket", "value"),
+            Input("view-page", "data"),
+            Input("label-filter", "value"),
+            Input("collection-filter", "value"),
+            State("bucketed-views", "data"),
+            State("paged-views", "data"),
+        )
 
-        # Melt the DataFrame
-        melted_df = collection_df.melt(
-            id_vars=["version", "release_date", "label", "collection"],
-            var_name="change_type",
-            value_name="count",
+        # Ask the server for a view only if it is not in the browser cache yet
+        self.app.clientside_callback(
+            """
+            function(key, version, cache) {
+                if (!key || (cache && cache[key])) {
+                    return window.dash_clientside.no_update;
+                }
+                return key;
+            }
+            """,
+            Output("requested-view", "data"),
+            Input("view-key", "data"),
+            Input("data-version", "data"),
+            State("figure-cache", "data"),
         )
 
-        # Drop rows where count is NaN
-        melted_df = melted_df.dropna(subset=["count"])
+        # Only the figures of the requested view are sent and merged into the
+        # cache, the views already loaded are not sent again
+        @self.app.callback(
+            Output("figure-cache", "data"),
+            Input("requested-view", "data"),
+            prevent_initial_call=True,
+        )
+        def load_view(view_key: str):
+            if not self._is_view_key(view_key):
+                raise PreventUpdate
+            cache = Patch()
+            with self._pinned():
+                cache[view_key] = self._view_payload(view_key)
+            return cache
+
+        # Render the selected view from the cache, without a server round-trip
+        self.app.clientside_callback(
+            """
+            function(key, cache, slots, template) {
+                const noUpdate = window.dash_clientside.no_update;
+                const view = key && cache ? cache[key] : undefined;
+                if (!view) {
+                    return [
+                        key ? "Loading..." : "Select a plot type",
+                        slots.map(() => noUpdate),
+                        slots.map(() => ({display: "none"})),
+                        noUpdate,
+                        {display: "none"},
+                    ];
+                }
+                const figures = JSON.parse(view.figures);
+                figures.forEach((figure) => { figure.layout.template = template; });
+                const paged = view.pages !== undefined;
+                return [
+                    view.title,
+                    slots.map((_, i) => i < figures.length ? figures[i] : noUpdate),
+                    slots.map((_, i) => i < figures.length ? {} : {display: "none"}),
+                    paged ? `Page ${view.page + 1} of ${view.pages} `
+                        + `(${view.total} collections)` : "",
+                    paged ? {} : {display: "none"},
+                ];
+            }
+            """,
+            Output("view-title", "children"),
+            Output({"type": "graph-slot", "index": ALL}, "figure"),
+            Output({"type": "graph-slot", "index": ALL}, "style"),
+            Output("page-info", "children"),
+            Output("pager", "style"),
+            Input("view-key", "data"),
+            Input("figure-cache", "data"),
+            State({"type": "graph-slot", "index": ALL}, "id"),
+            State("figure-template", "data"),
+        )
+
+    def _file_suffix(self, bucket: str) -> str:
+        # Figures of the default bucket keep their original file names
+        return "" if bucket == DEFAULT_TIME_BUCKET else f"_{bucket}"
+
+    def _plot_changes_overtime_per_collections(
+        self, bucket=DEFAULT_TIME_BUCKET, collections=None
+    ):
+        if collections is None:
+            collections = self._view_collections("changes-overtime-collection", bucket)
+        # A graph for each collection
+        return "Changes Over Time by Collection", [
+            self._plot_changes_overtime_per_collection(collection_name, bucket)
+            for collection_name in collections
+        ]
+
+    def _plot_changes_overtime_per_collection(
+        self, collection_name, bucket=DEFAULT_TIME_BUCKET
+    ):
+        # Slice of the changes cube for the specific collection
+        collection_df = self.counts["changes_cube"].collection(bucket, collection_name)
 
         # Create the plotly figure
         fig = px.scatter(
-            melted_df,
-            x="release_date",
+            collection_df,
+            x="period",
             y="count",
             color="change_type",
             title=f"Changes Over Time by {collection_name}",
             labels={
-                "release_date": "Release Date",
+                "period": BUCKET_TITLES[bucket],
                 "count": "Count",
                 "change_type": "Change Type",
             },
@@ -152,64 +690,62 @@ class Plotter:
             selector=dict(mode="markers"),
         )
 
-        self.save_figure(fig, f"changes_overtime_{collection_name}.png")
+        self.save_figure(
+            fig, f"changes_overtime_{collection_name}{self._file_suffix(bucket)}.png"
+        )
 
         return fig
 
-    def _plot_modules_overtime_per_label(self):
-        df = self.counts["changes_overtime"]
-
-        # Melt the DataFrame to long format
-        melted_df = df.melt(
-            id_vars=["version", "release_date", "label"],
-            var_name="change_type",
-            value_name="count",
+    def _plot_modules_overtime_per_label(self, bucket=DEFAULT_TIME_BUCKET):
+        # New modules and plugins from the changes cube
+        modules_df = self.counts["changes_cube"].change_types(
+            bucket, ["modules", "plugins"]
         )
 
-        # Filter to include 'modules' and 'plugins' change types and drop NaN values
-        melted_df = melted_df[
-            (melted_df["change_type"].isin(["modules", "plugins"]))
-            & (~melted_df["count"].isna())
-        ]
-
         # Plot the pie chart
         fig = px.scatter(
-            melted_df,
+            modules_df,
             y="count",
-            x="release_date",
+            x="period",
             color="label",
             title="New Modules Over Time per Label",
             symbol="label",
         )
 
-        fig.update_layout(xaxis_title="Release Date", yaxis_title="New Module Count")
+        fig.update_layout(
+            xaxis_title=BUCKET_TITLES[bucket], yaxis_title="New Module Count"
+        )
 
         # Save the figure locally
-        self.save_figure(fig, "module_overtime_label.png")
+        self.save_figure(fig, f"module_overtime_label{self._file_suffix(bucket)}.png")
 
-        # Define the layout of the Dash app
-        return html.Div(
-            [
-                html.H1("New Modules Over Time per Label"),
-                dcc.Graph(id="module-count-label", figure=fig),
-            ]
-        )
+        return "New Modules Over Time per Label", [fig]
 
-    def _plot_changes_per_label(self):
-        df = self.counts["changes_overtime"]
+    def _plot_changes_trend_per_label(self, bucket=DEFAULT_TIME_BUCKET):
+        # Total changes per label in each time bucket
+        trend_df = self.counts["changes_cube"].label_trend(bucket)
+        name = "Release" if bucket == DEFAULT_TIME_BUCKET else BUCKET_TITLES[bucket]
 
-        # Melt the DataFrame
-        melted_df = df.melt(
-            id_vars=["label", "version", "release_date", "collection"],
-            var_name="change_type",
-            value_name="count",
+        fig = px.line(
+            trend_df,
+            x="period",
+            y="count",
+            color="label",
+            markers=True,
+            title=f"Changes per {name} by Label",
+            labels={"period": BUCKET_TITLES[bucket], "count": "Change Count"},
         )
 
-        # Filter out rows with NaN values in count
-        melted_df = melted_df[~melted_df["count"].isna()]
+        self.save_figure(fig, f"changes_trend_label{self._file_suffix(bucket)}.png")
+
+        return f"Changes per {name} by Label", [fig]
+
+    def _plot_changes_per_label(self):
+        # Totals by label and change type from the changes cube
+        totals_df = self.counts["changes_cube"].totals
 
         fig = px.bar(
-            melted_df,
+            totals_df,
             x="change_type",
             y="count",
             color="label",
@@ -223,35 +759,25 @@ class Plotter:
 
         self.save_figure(fig, "changes_label.png")
 
-        # Layout of the Dash app
-        return html.Div(
-            [
-                html.H1("Changes per Version by Label"),
-                dcc.Graph(id="changes-label", figure=fig),
-            ]
-        )
+        return "Changes per Version by Label", [fig]
 
-    def _plot_changes_per_collection(self):
-        graphs = []
-
-        df = self.counts["changes_overtime"]
-
-        # Melt the DataFrame to long format
-        melted_df = df.melt(
-            id_vars=["label", "version", "release_date", "collection"],
-            var_name="change_type",
-            value_name="count",
-        )
-
-        # Filter out rows with NaN values in count
-        melted_df = melted_df[~melted_df["count"].isna()]
+    def _plot_changes_per_collection(
+        self, bucket=DEFAULT_TIME_BUCKET, collections=None
+    ):
+        figures = []
+        cube = self.counts["changes_cube"]
+        if collections is None:
+            collections = self._view_collections("changes-collection", bucket)
+        # Releases are shown by version, other buckets by period
+        x = "version" if bucket == DEFAULT_TIME_BUCKET else "period"
+        x_title = "Version" if bucket == DEFAULT_TIME_BUCKET else BUCKET_TITLES[bucket]
 
         # Plot for each collection
-        for collection in melted_df["collection"].unique():
-            df_collection = melted_df[melted_df["collection"] == collection]
+        for collection in collections:
+            df_collection = cube.collection(bucket, collection)
             fig = px.bar(
                 df_collection,
-                x="version",
+                x=x,
                 y="count",
                 color="change_type",
                 title=f"Changes Over Time for {collection}",
@@ -260,31 +786,29 @@ class Plotter:
             )
 
             fig.update_layout(
-                title=f"Changes per Version for Collection: {collection}",
-                xaxis_title="Version",
+                title=f"Changes per {x_title} for Collection: {collection}",
+                xaxis_title=x_title,
                 yaxis_title="Count",
                 height=600,
             )
 
-            self.save_figure(fig, f"changes_version_{collection}.png")
+            self.save_figure(
+                fig, f"changes_version_{collection}{self._file_suffix(bucket)}.png"
+            )
 
-            # Append the graph to the graphs list
-            graphs.append(dcc.Graph(figure=fig))
+            # Append the figure to the list of figures
+            figures.append(fig)
 
-        # Layout of the Dash app
-        return html.Div(
-            children=[
-                html.H1("Changes per Version for Collection"),
-                html.Div(graphs),  # Display all graphs in a single HTML div
-            ]
-        )
+        return f"Changes per {x_title} for Collection", figures
 
-    def _plot_most_updated_files(self):
-        graphs = []
+    def _plot_most_updated_files(self, collections=None):
+        figures = []
         most_updated = self.counts["most_updated_files"]
+        if collections is None:
+            collections = self._view_collections("top-files")
 
         # Iterate over each collection to create a separate graph
-        for collection in most_updated["collection"].unique():
+        for collection in collections:
             # Filter data for the current collection
             data_collection = most_updated[most_updated["collection"] == collection]
 
@@ -293,22 +817,16 @@ class Plotter:
                 data_collection,
                 x="file_name",
                 y="count",
-                title=f"Top 5 Most Updated Files by Collection: {collection}",
+                title=f"Top {self.top_n} Most Updated Files by Collection: {collection}",
             )
 
             # Save the figure
             self.save_figure(fig, f"top_files_plot_{collection}.png")
 
-            # Add the figure to the list of graphs
-            graphs.append(dcc.Graph(figure=fig))
+            # Add the figure to the list of figures
+            figures.append(fig)
 
-        # Layout of the Dash app
-        return html.Div(
-            children=[
-                html.H1("Top 5 Most Updated Files by Collection"),
-                html.Div(graphs),  # Display all graphs in a single HTML div
-            ]
-        )
+        return f"Top {self.top_n} Most Updated Files by Collection", figures
 
     def _plot_releases_per_label(self):
         df = self.counts["flatten"]
@@ -327,13 +845,7 @@ class Plotter:
         # Save the figure locally
         self.save_figure(fig, "release_counts_per_label.png")
 
-        # Define the layout of the Dash app
-        return html.Div(
-            [
-                html.H1("Total Releases by Label"),
-                dcc.Graph(id="release-counts-label", figure=fig),
-            ]
-        )
+        return "Total Releases by Label", [fig]
 
     def _plot_releases_per_collection(self):
         df = self.counts["flatten"]
@@ -349,23 +861,19 @@ class Plotter:
         # Save the figure locally
         self.save_figure(fig, "release_counts_per_collection.png")
 
-        # Define the layout of the Dash app
-        return html.Div(
-            [
-                html.H1("Total Releases by Label"),
-                dcc.Graph(id="release-counts-collection", figure=fig),
-            ]
-        )
+        return "Total Releases by Collection", [fig]
 
-    def _plot_average_complexity(self):
+    def _plot_average_per_collection(self, metric, title, yaxis_title, filename):
         labels = []
         values = []
         colors = (
             px.colors.qualitative.Alphabet
         )  # Using Plotly's qualitative color scheme
         for label, data in self.stats.items():
-            labels.extend(data.keys())
-            values.extend([float(value["avg_complexity"]) for value in data.values()])
+            for collection, value in data.items():
+                if metric in value:
+                    labels.append(collection)
+                    values.append(float(value[metric]))
 
         # Generate a color for each collection based on its name or index
         collection_colors = {
@@ -388,8 +896,8 @@ class Plotter:
             )
 
         fig_layout = {
-            "title": "Avg. Cyclomatic Complexity by Collection",
-            "yaxis": {"title": "Avg. Cyclomatic Complexity"},
+            "title": title,
+            "yaxis": {"title": yaxis_title},
             "barmode": "group",
             "showlegend": False,
             "margin": {"autoexpand": True},
@@ -402,79 +910,286 @@ class Plotter:
         }
 
         # Save the figure
-        self.save_figure(fig, "avg_complexity_per_collection.png")
+        self.save_figure(fig, filename)
+
+        return title, [fig]
+
+    def _plot_average_complexity(self):
+        return self._plot_average_per_collection(
+            "avg_complexity",
+            "Avg. Cyclomatic Complexity by Collection",
+            "Avg. Cyclomatic Complexity",
+            "avg_complexity_per_collection.png",
+        )
+
+    def _plot_maintainability_index(self):
+        return self._plot_average_per_collection(
+            "maintainability_index",
+            "Avg. Maintainability Index by Collection",
+            "Avg. Maintainability Index",
+            "maintainability_index_per_collection.png",
+        )
+
+    def _plot_raw_metrics(self):
+        collections = []
+        raw_metrics = []
+        for label, data in self.stats.items():
+            for collection, value in data.items():
+                if "raw_metrics" in value:
+                    collections.append(collection)
+                    raw_metrics.append(value["raw_metrics"])
+
+        # Stack source, comment and blank lines for each collection
+        fig_data = [
+            {
+                "x": collections,
+                "y": [metrics[metric] for metrics in raw_metrics],
+                "type": "bar",
+                "name": name,
+                "hoverinfo": "text+y",
+            }
+            for metric, name in (
+                ("sloc", "Source Lines"),
+                ("comments", "Comment Lines"),
+                ("multi", "Multi-line Strings"),
+                ("blank", "Blank Lines"),
+            )
+        ]
+
+        fig_layout = {
+            "title": "Lines of Code by Collection",
+            "yaxis": {"title": "Lines"},
+            "barmode": "stack",
+            "showlegend": True,
+            "margin": {"autoexpand": True},
+            "height": 500,
+        }
+
+        fig = {
+            "data": fig_data,
+            "layout": fig_layout,
+        }
+
+        # Save the figure
+        self.save_figure(fig, "raw_metrics_per_collection.png")
+
+        return "Lines of Code by Collection", [fig]
+
+    def _plot_most_complex_files(self, collections=None):
+        figures = []
+        colors = px.colors.qualitative.Alphabet
+        stats = self._collection_stats()
+        if collections is None:
+            collections = self._view_collections("top-complex-files")
+        for collection_name in collections:
+            data = stats[collection_name]
+            plugin_colors = {
+                plugin: colors[i % len(colors)]
+                for i, (plugin, _) in enumerate(data["complex_files"][: self.top_n])
+            }
+
+            fig_data = []
+
+            # Add bars for each plugin
+            for i, (plugin, count) in enumerate(data["complex_files"]):
+                fig_data.append(
+                    {
+                        "x": [i],
+                        "y": [count],
+                        "type": "bar",
+                        "name": plugin,
+                        "marker_color": plugin_colors[plugin],
+                        "hoverinfo": "text+y",
+                    }
+                )
+
+            fig_layout = {
+                "title": f"Top {self.top_n} Most Complex Files by Collection {collection_name}",
+                "yaxis": {"title": "Cyclomatic Complexity"},
+                "barmode": "group",
+                "showlegend": True,
+                "legend": {
+                    "orientation": "h",
+                    "yanchor": "top",
+                    "y": -0.3,
+                    "xanchor": "center",
+                    "x": 0.5,
+                },
+            }
+
+            fig = {
+                "data": fig_data,
+                "layout": fig_layout,
+            }
+
+            # Save the figure
+            self.save_figure(fig, f"most_complex_files_{collection_name}.png")
 
-        # Create the Dash layout
-        return html.Div(
+            figures.append(fig)
+
+        return f"Top {self.top_n} Most Complex Files by Collection", figures
+
+    def _plot_hotspots(self):
+        # Join the number of updates of each file with its complexity, files
+        # both often updated and complex are the first candidates for a refactor
+        complexity = pd.DataFrame(
             [
-                html.H1("Avg. Cyclomatic Complexity by Collection"),
-                dcc.Graph(id="avg-complexity", figure=fig, style={"width": "100%"}),
-            ]
+                {"collection": collection, "file_name": path, "complexity": value}
+                for collections in self.stats.values()
+                for collection, data in collections.items()
+                for path, value in data.get("file_complexity", {}).items()
+            ],
+            columns=["collection", "file_name", "complexity"],
+        )
+        hotspots = self.counts["file_updates"].merge(
+            complexity, on=["collection", "file_name"]
         )
 
-    def _plot_most_complex_files(self):
-        plots = []
-        colors = (
-            px.colors.qualitative.Alphabet
+        fig = px.scatter(
+            hotspots,
+            x="count",
+            y="complexity",
+            color="collection",
+            hover_name="file_name",
+            title="Churn x Complexity Hotspots",
+            labels={
+                "count": "Changelog Entries",
+                "complexity": "Cyclomatic Complexity",
+                "collection": "Collection",
+            },
         )
-        for _, collections in self.stats.items():
-            for collection_name, data in collections.items():
-                plugin_colors = {
-                    plugin: colors[i % len(colors)]
-                    for i, (plugin, _) in enumerate(data["complex_files"][:5])
-                }
 
-                fig_data = []
+        self.save_figure(fig, "hotspots.png")
 
-                # Add bars for each plugin
-                for i, (plugin, count) in enumerate(data["complex_files"]):
-                    fig_data.append(
-                        {
-                            "x": [i],
-                            "y": [count],
-                            "type": "bar",
-                            "name": plugin,
-                            "marker_color": plugin_colors[plugin],
-                            "hoverinfo": "text+y",
-                        }
-                    )
+        return "Churn x Complexity Hotspots", [fig]
 
-                fig_layout = {
-                    "title": f"Top 5 Most Complex Files by Collection {collection_name}",
-                    "yaxis": {"title": "Cyclomatic Complexity"},
-                    "barmode": "group",
-                    "showlegend": True,
-                    "legend": {
-                        "orientation": "h",
-                        "yanchor": "top",
-                        "y": -0.3,
-                        "xanchor": "center",
-                        "x": 0.5,
-                    },
-                }
+    def _churn(self) -> Dict:
+        # Git history churn of each collection
+        return {
+            collection: data["churn"]
+            for collections in self.stats.values()
+            for collection, data in collections.items()
+            if data.get("churn")
+        }
 
-                fig = {
-                    "data": fig_data,
-                    "layout": fig_layout,
+    def _plot_most_churned_files(self, collections=None):
+        figures = []
+        churns = self._churn()
+        if collections is None:
+            collections = list(churns)
+        for collection_name in collections:
+            churn = churns[collection_name]
+            files = [path for path, _, _, _ in churn["top_files"]]
+            commits = [commits for _, _, _, commits in churn["top_files"]]
+
+            # Lines added and removed stacked for each file
+            fig_data = [
+                {
+                    "x": files,
+                    "y": [file_churn[field] for file_churn in churn["top_files"]],
+                    "type": "bar",
+                    "name": name,
+                    "customdata": commits,
+                    "hovertemplate": "%{y} lines, %{customdata} commits",
                 }
+                for field, name in ((1, "Lines Added"), (2, "Lines Removed"))
+            ]
 
-                # Save the figure
-                self.save_figure(fig, f"most_complex_files_{collection_name}.png")
+            fig_layout = {
+                "title": f"Top {self.top_n} Most Churned Files by Collection {collection_name}",
+                "yaxis": {"title": "Lines Changed"},
+                "barmode": "stack",
+                "showlegend": True,
+            }
+
+            fig = {
+                "data": fig_data,
+                "layout": fig_layout,
+            }
+
+            self.save_figure(fig, f"most_churned_files_{collection_name}.png")
+
+            figures.append(fig)
+
+        return f"Top {self.top_n} Most Churned Files by Collection", figures
+
+    def _plot_churn_per_release(self, collections=None):
+        figures = []
+        churns = self._churn()
+        if collections is None:
+            collections = list(churns)
+        for collection_name in collections:
+            churn = churns[collection_name]
+            releases = [release["tag"] for release in churn["releases"]]
+            # Each release is compared with its nearest ancestor tag, which is
+            # not the previous release when it was tagged on another branch
+            since = [
+                f"since {release['previous'] or 'the start of the window'}"
+                for release in churn["releases"]
+            ]
+            # Totals of each release over its files
+            totals = [
+                [sum(values) for values in zip(*release["files"].values())] or [0, 0, 0]
+                for release in churn["releases"]
+            ]
 
-                plots.append(
-                    html.Div(
-                        [
-                            html.H3(
-                                f"Top 5 Most Complex Files by Collection {collection_name}"
-                            ),
-                            dcc.Graph(
-                                id=f"most-complex-files-plot-{collection_name}",
-                                figure=fig,
-                            ),
-                        ]
-                    )
-                )
-        return plots
+            fig_data = [
+                {
+                    "x": releases,
+                    "y": [total[field] for total in totals],
+                    "hovertext": since,
+                    "type": "bar",
+                    "name": name,
+                }
+                for field, name in ((0, "Lines Added"), (1, "Lines Removed"))
+            ]
+            fig_data.append(
+                {
+                    "x": releases,
+                    "y": [total[2] for total in totals],
+                    "type": "scatter",
+                    "mode": "lines+markers",
+                    "name": "File Changes",
+                    "yaxis": "y2",
+                }
+            )
 
-    def run(self):
-        self.app.run_server(debug=True)
+            fig_layout = {
+                "title": f"Churn per Release for Collection: {collection_name}",
+                "xaxis": {"title": "Release", "type": "category"},
+                "yaxis": {"title": "Lines Changed"},
+                "yaxis2": {
+                    "title": "File Changes",
+                    "overlaying": "y",
+                    "side": "right",
+                },
+                "barmode": "group",
+                "showlegend": True,
+            }
+
+            fig = {
+                "data": fig_data,
+                "layout": fig_layout,
+            }
+
+            self.save_figure(fig, f"churn_per_release_{collection_name}.png")
+
+            figures.append(fig)
+
+        return "Churn per Release by Collection", figures
+
+    def report(self):
+        # Build every view, each of them saves its figures in saved_graphs
+        self.save = True
+        try:
+            for plot_type, view in self._views().items():
+                if plot_type in BUCKETED_VIEWS:
+                    for bucket in TIME_BUCKETS:
+                        view(bucket)
+                else:
+                    view()
+        finally:
+            self.save = False
+
+    def run(self, **kwargs):
+        self.app.run(debug=True, **kwargs)
@@ -0,0 +1,354 @@
+import hashlib
+import logging
+import os
+import random
+import shutil
+import subprocess
+import time
+from contextlib import nullcontext
+from typing import Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+
+# Git tree entry modes for sub-trees and regular blobs
+TREE_MODE = "40000"
+BLOB_MODES = ("100644", "100755")
+
+# Seconds a remote has to list its refs
+REMOTE_TIMEOUT = 60
+
+# Git errors worth retrying, anything else (e.g. repository not found) fails
+# immediately
+TRANSIENT_GIT_ERRORS = (
+    "could not resolve host",
+    "connection timed out",
+    "connection reset",
+    "operation timed out",
+    "failed to connect",
+    "early eof",
+    "rpc failed",
+    "the remote end hung up",
+    "internal server error",
+    "502",
+    "503",
+    "504",
+    "429",
+)
+
+
+def is_transient_git_error(error: subprocess.CalledProcessError) -> bool:
+    stderr = error.stderr or b""
+    if isinstance(stderr, bytes):
+        stderr = stderr.decode("utf-8", "replace")
+    stderr = stderr.lower()
+    return any(message in stderr for message in TRANSIENT_GIT_ERRORS)
+
+
+def tags_fingerprint(tags: Dict[str, str]) -> str:
+    # Digest of the name and object name of every tag, which changes when a
+    # tag is added, removed or moved, whatever its version
+    digest = hashlib.sha1()
+    for tag, sha in sorted(tags.items()):
+        digest.update(f"{sha} {tag}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Read-only access to a cloned repository. A single `git cat-file --batch` and
+# `git cat-file --batch-check` process is kept open for the lifetime of the
+# object, so reading tags, trees and blobs does not fork a git process per object.
+class GitRepository:
+    def __init__(self, path: str):
+        self.path = path
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.setLevel(logging.DEBUG)
+        self._batch: Optional[subprocess.Popen] = None
+        self._batch_check: Optional[subprocess.Popen] = None
+        self._tags: Optional[List[str]] = None
+        self._tag_dates: Dict[str, int] = {}
+
+    @classmethod
+    def clone(
+        cls,
+        url: str,
+        path: str,
+        retries: int = 0,
+        backoff: float = 2.0,
+        slot: Optional[Callable[[], ContextManager]] = None,
+    ) -> "GitRepository":
+        logger = logging.getLogger(cls.__name__)
+        for attempt in range(retries + 1):
+            try:
+                # Hold a network slot, if any, only while cloning
+                with slot() if slot else nullcontext():
+                    # A bare clone is enough since every object is read through
+                    # cat-file
+                    subprocess.run(
+                        ["git", "clone", "--bare", "--quiet", url, path],
+                        check=True,
+                        capture_output=True,
+                    )
+                return cls(path)
+            except subprocess.CalledProcessError as e:
+                if attempt == retries or not is_transient_git_error(e):
+                    raise
+                # Exponential backoff with jitter before the next attempt
+                delay = backoff * 2**attempt * random.uniform(0.5, 1.5)
+                reason = e.stderr.decode("utf-8", "replace").strip()
+                logger.warning(
+                    f"Transient error cloning {url} (attempt {attempt + 1}), "
+                    f"retrying in {delay:.1f}s: {reason}"
+                )
+                shutil.rmtree(path, ignore_errors=True)
+                time.sleep(delay)
+
+    @staticmethod
+    def remote_tags(url: str, timeout: float = REMOTE_TIMEOUT) -> Dict[str, str]:
+        # Object name of each tag of a remote repository, from `git ls-remote`
+        # without cloning it. Raises subprocess.TimeoutExpired when the remote
+        # does not answer within timeout seconds.
+        output = subprocess.run(
+            ["git", "ls-remote", "--tags", "--refs", url],
+            check=True,
+            capture_output=True,
+            timeout=timeout,
+        ).stdout
+        tags = {}
+        for line in output.splitlines():
+            # <sha>\trefs/tags/<tag>
+            sha, ref = str(line, "utf-8").split("\t", 1)
+            tags[ref[len("refs/tags/") :]] = sha
+        return tags
+
+    def __enter__(self) -> "GitRepository":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _spawn(self, mode: str) -> subprocess.Popen:
+        return subprocess.Popen(
+            ["git", "cat-file", mode],
+            cwd=self.path,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def _request(self, process: subprocess.Popen, spec: str) -> Optional[List[bytes]]:
+        process.stdin.write(spec.encode("utf-8") + b"\n")
+        process.stdin.flush()
+        header = process.stdout.readline()
+        if not header:
+            raise RuntimeError(f"git cat-file exited while reading {spec}")
+        fields = header.split()
+        if fields[-1] in (b"missing", b"ambiguous"):
+            return None
+        # <sha> <type> <size>
+        return fields
+
+    def info(self, spec: str) -> Optional[Tuple[str, str, int]]:
+        if self._batch_check is None:
+            self._batch_check = self._spawn("--batch-check")
+        fields = self._request(self._batch_check, spec)
+        if fields is None:
+            return None
+        return fields[0].decode(), fields[1].decode(), int(fields[2])
+
+    def read_object(self, spec: str) -> Optional[Tuple[str, memoryview]]:
+        if self._batch is None:
+            self._batch = self._spawn("--batch")
+        fields = self._request(self._batch, spec)
+        if fields is None:
+            return None
+
+        size = int(fields[2])
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        read = 0
+        while read < size:
+            chunk = self._batch.stdout.readinto(view[read:])
+            if not chunk:
+                raise RuntimeError(f"Unexpected end of git cat-file output for {spec}")
+            read += chunk
+        # Every object is followed by a single LF
+        self._batch.stdout.read(1)
+
+        return fields[1].decode(), view
+
+    def exists(self, spec: str) -> bool:
+        return self.info(spec) is not None
+
+    def read_blob(self, spec: str) -> Optional[memoryview]:
+        result = self.read_object(spec)
+        if result is None or result[0] != "blob":
+            return None
+        return result[1]
+
+    def tags(self) -> List[str]:
+        # Equivalent of `git tag --sort=creatordate`
+        if self._tags is None:
+            dated_tags = []
+            for tag in sorted(self.tag_refs()):
+                result = self.read_object(f"refs/tags/{tag}")
+                if result is None:
+                    continue
+                dated_tags.append((self._creator_date(*result), tag))
+            self._tags = [tag for _, tag in sorted(dated_tags)]
+            self._tag_dates = {tag: date for date, tag in dated_tags}
+        return self._tags
+
+    def tag_date(self, tag: str) -> int:
+        # Creator date of the tag, as a Unix timestamp
+        self.tags()
+        return self._tag_dates.get(tag, 0)
+
+    def tag_refs(self) -> Dict[str, str]:
+        # Object name of each tag, as listed by `git ls-remote --tags --refs`
+        # on the repository the clone was made from
+        tags = {}
+        packed_refs = os.path.join(self.path, "packed-refs")
+        if os.path.exists(packed_refs):
+            with open(packed_refs, "r") as file:
+                for line in file:
+                    if line.startswith(("#", "^")):
+                        continue
+                    sha, ref = line.rstrip("\n").split(" ", 1)
+                    if ref.startswith("refs/tags/"):
+                        tags[ref[len("refs/tags/") :]] = sha
+
+        # Loose refs take precedence over packed ones
+        tags_dir = os.path.join(self.path, "refs", "tags")
+        for root, _, files in os.walk(tags_dir):
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                ref = os.path.relpath(path, tags_dir)
+                with open(path, "r") as file:
+                    tags[ref.replace(os.sep, "/")] = file.read().strip()
+
+        return tags
+
+    @staticmethod
+    def _creator_date(object_type: str, content: memoryview) -> int:
+        # Annotated tags are dated by their tagger, lightweight ones by the commit
+        field = b"tagger " if object_type == "tag" else b"committer "
+        data = content.obj
+        if data.startswith(field):
+            start = 0
+        else:
+            start = data.find(b"\n" + field)
+            if start < 0:
+                return 0
+            start += 1
+        end = data.find(b"\n", start)
+        # <name> <email> <timestamp> <timezone>
+        return int(data[start:end].rsplit(b" ", 2)[1])
+
+    def tree(self, spec: str) -> List[Tuple[str, str, str]]:
+        result = self.read_object(spec)
+        if result is None or result[0] != "tree":
+            return []
+
+        entries = []
+        view = result[1]
+        data = view.obj
+        position = 0
+        # Each entry is "<mode> <name>\0<20 byte sha>"
+        while position < len(data):
+            space = data.find(b" ", position)
+            null = data.find(b"\0", space)
+            mode = str(view[position:space], "ascii")
+            name = str(view[space + 1 : null], "utf-8", "surrogateescape")
+            sha = view[null + 1 : null + 21].hex()
+            entries.append((mode, name, sha))
+            position = null + 21
+
+        return entries
+
+    def walk(
+        self,
+        rev: str,
+        skip_dir: Optional[Callable[[str], bool]] = None,
+        folder: Optional[str] = None,
+    ) -> Iterator[Tuple[str, str]]:
+        # Yield (path, sha) for every blob reachable from the tree of rev, or
+        # from one of its folders
+        if folder:
+            pending = [(f"{folder}/", f"{rev}:{folder}")]
+        else:
+            pending = [("", f"{rev}^{{tree}}")]
+        while pending:
+            prefix, spec = pending.pop()
+            for mode, name, sha in self.tree(spec):
+                path = f"{prefix}{name}"
+                if mode == TREE_MODE:
+                    if skip_dir is None or not skip_dir(path):
+                        pending.append((f"{path}/", sha))
+                elif mode in BLOB_MODES:
+                    yield path, sha
+
+    def log_numstat(
+        self, revs: List[str]
+    ) -> Iterator[Tuple[str, List[str], bool, List[Tuple[str, int, int]]]]:
+        # Yield (sha, parents, boundary, [(path, added, removed)]) for every
+        # commit of `git log --numstat --boundary <revs>`, children before
+        # their parents, so the commit graph can be walked along the way.
+        # Boundary commits are the excluded parents of the listed commits,
+        # merges have no files. The history is not limited to any path, so
+        # the parents are the actual ones. The output is parsed as it is
+        # streamed, one commit at a time, so it is never held in memory.
+        # Binary files count as 0 lines.
+        process = subprocess.Popen(
+            [
+                "git",
+                "-c",
+                "core.quotePath=false",
+                "log",
+                "--numstat",
+                "--no-renames",
+                "--topo-order",
+                "--boundary",
+                "--format=%x00%m %H %P",
+                *revs,
+            ],
+            cwd=self.path,
+            stdout=subprocess.PIPE,
+        )
+        commit = None
+        files: List[Tuple[str, int, int]] = []
+        try:
+            for line in process.stdout:
+                if line.startswith(b"\0"):
+                    if commit is not None:
+                        yield (*commit, files)
+                    # <mark> <sha> <parent>...
+                    mark, sha, *parents = str(line[1:], "utf-8").split()
+                    commit = (sha, parents, mark == "-")
+                    files = []
+                elif line.strip():
+                    added, removed, path = line.rstrip(b"\n").split(b"\t", 2)
+                    files.append(
+                        (
+                            str(path, "utf-8", "surrogateescape"),
+                            int(added) if added != b"-" else 0,
+                            int(removed) if removed != b"-" else 0,
+                        )
+                    )
+            if commit is not None:
+                yield (*commit, files)
+        finally:
+            process.stdout.close()
+            if process.wait() not in (0, -13):
+                self.logger.warning(f"git log {' '.join(revs)} failed in {self.path}")
+
+    def tag_commit(self, tag: str) -> Optional[str]:
+        # Commit a tag points to, through any annotated tag object
+        info = self.info(f"refs/tags/{tag}^{{commit}}")
+        return info[0] if info else None
+
+    def close(self):
+        for process in (self._batch, self._batch_check):
+            if process is None:
+                continue
+            process.stdin.close()
+            process.wait()
+            process.stdout.close()
+        self._batch = None
+        self._batch_check = None
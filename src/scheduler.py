@@ -0,0 +1,226 @@
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import time
+import urllib.request
+from contextlib import nullcontext
+from itertools import repeat
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+# Estimated size of a repository whose size can not be fetched
+DEFAULT_REPO_SIZE_MB = 100
+# Share of the free temporary disk space used when no budget is configured
+DEFAULT_DISK_SHARE = 0.8
+DEFAULT_MAX_CONCURRENT_CLONES = 4
+# Sizes fetched from the GitHub API, kept between runs
+DEFAULT_SIZE_CACHE_FILE = "repo_sizes.json"
+# Seconds a cached size is used before it is fetched again
+SIZE_CACHE_TTL = 7 * 24 * 3600
+
+GITHUB_REPO_PATTERN = re.compile(r"github\.com[/:]([^/]+)/([^/]+?)(?:\.git)?/?$")
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Semaphore limiting the number of concurrent clones, shared with the workers
+_clone_slots = None
+
+
+def _init_worker(clone_slots):
+    global _clone_slots
+    _clone_slots = clone_slots
+
+
+def clone_slot():
+    # Network slot held by workers while cloning, a no-op outside the scheduler
+    return _clone_slots if _clone_slots is not None else nullcontext()
+
+
+def _load_size_cache(path: str) -> Dict:
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_size_cache(path: str, cache: Dict):
+    # Write to a temporary file first, as write_snapshot, so concurrent runs
+    # never read a partial cache
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w") as file:
+            json.dump(cache, file, indent=2, sort_keys=True)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logging.getLogger("Scheduler").warning(
+            f"Unable to save the repository sizes to {path}: {e}"
+        )
+
+
+def estimate_repo_size(collection: Dict, cache: Optional[Dict] = None) -> int:
+    # Size in MB, from the collection configuration, the cache of the sizes
+    # fetched by previous runs or the GitHub API
+    if collection.get("size_mb"):
+        return int(collection["size_mb"])
+
+    match = GITHUB_REPO_PATTERN.search(collection.get("github_repo", ""))
+    if not match:
+        return DEFAULT_REPO_SIZE_MB
+
+    repo = f"{match.group(1)}/{match.group(2)}"
+    cached = cache.get(repo) if cache is not None else None
+    if cached and time.time() - cached["fetched_at"] < SIZE_CACHE_TTL:
+        return cached["size_mb"]
+
+    request = urllib.request.Request(f"https://api.github.com/repos/{repo}")
+    if os.environ.get("GITHUB_TOKEN"):
+        request.add_header("Authorization", f"token {os.environ['GITHUB_TOKEN']}")
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            # GitHub reports the size in KB
+            size_mb = max(1, json.load(response)["size"] // 1024)
+    except Exception as e:
+        # e.g. the rate limit of the API, 60 requests per hour without a token
+        size_mb = cached["size_mb"] if cached else DEFAULT_REPO_SIZE_MB
+        logging.getLogger("Scheduler").warning(
+            f"Unable to fetch the size of {repo} from the GitHub API ({e}), "
+            f"assuming {size_mb} MB. Set size_mb on the collection or "
+            "GITHUB_TOKEN."
+        )
+        return size_mb
+
+    if cache is not None:
+        cache[repo] = {"size_mb": size_mb, "fetched_at": time.time()}
+    return size_mb
+
+
+def describe_error(e: Exception) -> str:
+    # The message of a failed job, with the stderr of git when it failed
+    error = str(e)
+    stderr = getattr(e, "stderr", None)
+    if isinstance(stderr, bytes):
+        error += f" {stderr.decode('utf-8', 'replace').strip()}"
+    return error
+
+
+def estimate_repo_sizes(
+    collections: List[Dict], cache_file: str = DEFAULT_SIZE_CACHE_FILE
+) -> List[int]:
+    cache = _load_size_cache(cache_file)
+    fetched = dict(cache)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        sizes = list(executor.map(estimate_repo_size, collections, repeat(fetched)))
+    if fetched != cache:
+        _save_size_cache(cache_file, fetched)
+    return sizes
+
+
+class Job:
+    def __init__(self, collection: Dict, size_mb: int):
+        self.collection = collection
+        self.name = collection["name"]
+        self.size_mb = size_mb
+        self.status = PENDING
+        self.error: Optional[str] = None
+        self.started: Optional[float] = None
+        self.duration: Optional[float] = None
+
+
+# Runs the per-collection work in a pool of processes. Jobs are started from the
+# largest estimated repository down, as long as the estimated temporary disk
+# usage of the running jobs stays within max_disk_mb, while clones are limited
+# to max_concurrent_clones at a time through a semaphore shared with the workers.
+class Scheduler:
+    def __init__(
+        self,
+        collections: List[Dict],
+        workers: Optional[int] = None,
+        max_disk_mb: Optional[int] = None,
+        max_concurrent_clones: int = DEFAULT_MAX_CONCURRENT_CLONES,
+    ):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.setLevel(logging.DEBUG)
+        self.workers = workers or os.cpu_count() or 1
+        self.max_disk_mb = max_disk_mb or int(
+            shutil.disk_usage(tempfile.gettempdir()).free
+            / (1024 * 1024)
+            * DEFAULT_DISK_SHARE
+        )
+        self.max_concurrent_clones = max_concurrent_clones
+
+        sizes = estimate_repo_sizes(collections)
+        self.jobs = sorted(
+            (Job(collection, size) for collection, size in zip(collections, sizes)),
+            key=lambda job: job.size_mb,
+            reverse=True,
+        )
+
+    def run(self, func: Callable, *args) -> Iterator[Tuple[Job, object]]:
+        # Yield (job, result) as jobs complete, result is None for failed jobs
+        pending = list(self.jobs)
+        running: Dict = {}
+        disk_in_use = 0
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(multiprocessing.Semaphore(self.max_concurrent_clones),),
+        ) as executor:
+            while pending or running:
+                for job in list(pending):
+                    if len(running) >= self.workers:
+                        break
+                    # A job larger than the whole budget still runs, alone
+                    if running and disk_in_use + job.size_mb > self.max_disk_mb:
+                        continue
+                    pending.remove(job)
+                    job.status = RUNNING
+                    job.started = time.time()
+                    disk_in_use += job.size_mb
+                    running[executor.submit(func, job.collection, *args)] = job
+                    self.logger.info(
+                        f"Started {job.name} (~{job.size_mb} MB, "
+                        f"{disk_in_use}/{self.max_disk_mb} MB of disk budget in use)"
+                    )
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    disk_in_use -= job.size_mb
+                    job.duration = time.time() - job.started
+                    try:
+                        result = future.result()
+                        job.status = DONE
+                    except Exception as e:
+                        result = None
+                        job.status = FAILED
+                        job.error = describe_error(e)
+                    self.logger.info(
+                        f"{job.status.capitalize()} {job.name} in {job.duration:.1f}s"
+                        + (f": {job.error}" if job.error else "")
+                    )
+                    yield job, result
+
+        self.log_status()
+
+    def log_status(self):
+        # Per-job status summary
+        for job in self.jobs:
+            duration = f"{job.duration:.1f}s" if job.duration is not None else "-"
+            self.logger.info(
+                f"{job.name:<45} {job.status:<8} {job.size_mb:>6} MB {duration:>8}"
+                + (f"  {job.error}" if job.error else "")
+            )
+        failed = [job.name for job in self.jobs if job.status == FAILED]
+        if failed:
+            self.logger.warning(f"{len(failed)} collection(s) failed: {failed}")
@@ -0,0 +1,130 @@
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+# Words, keeping dotted names such as "amazon.aws" or "1.2.0" together
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+(?:\.[a-z0-9_]+)*")
+# Component prefix of a changelog entry, e.g. "ec2_instance - Fix crash."
+ENTRY_PATTERN = re.compile(r"^([^\s]+)\s+-\s+(.+)", re.DOTALL)
+
+# Fields of an indexed entry
+LABEL, COLLECTION, VERSION, RELEASE_DATE, CATEGORY, COMPONENT, TEXT = range(7)
+
+
+def tokenize(text: str, parts: bool = False) -> List[str]:
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    if parts:
+        # Also index each part of dotted names, so "amazon.aws.ec2_instance"
+        # is found by "ec2_instance"
+        tokens += [
+            part for token in tokens if "." in token for part in token.split(".")
+        ]
+    return tokens
+
+
+# Inverted index over changelog entries. Every term of the entry text,
+# component, category, collection and version points to the sorted ids of the
+# entries containing it. Once frozen, postings are packed into arrays and terms
+# are kept sorted, so that prefix queries are a binary search followed by a
+# scan of the matching terms.
+class SearchIndex:
+    def __init__(self):
+        self.entries: List[Tuple] = []
+        self.postings: Dict[str, array] = {}
+        self.terms: List[str] = []
+        self._strings: Dict[str, str] = {}
+
+    def _shared(self, value) -> str:
+        # Labels, collections and versions repeat a lot, store each once
+        value = "" if value is None else str(value)
+        return self._strings.setdefault(value, value)
+
+    def add(
+        self,
+        label: str,
+        collection: str,
+        version: str,
+        release_date,
+        category: str,
+        text: str,
+    ):
+        match = ENTRY_PATTERN.match(text)
+        component = match.group(1) if match else ""
+        entry_id = len(self.entries)
+        self.entries.append(
+            (
+                self._shared(label),
+                self._shared(collection),
+                self._shared(version),
+                self._shared(release_date),
+                self._shared(category),
+                component,
+                text,
+            )
+        )
+
+        fields = (text, category, collection, version)
+        for term in set(
+            token for field in fields for token in tokenize(field, parts=True)
+        ):
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = array("I")
+            # Entries are added in id order, so postings stay sorted
+            postings.append(entry_id)
+
+    def freeze(self) -> "SearchIndex":
+        self.terms = sorted(self.postings)
+        self._strings = {}
+        return self
+
+    def _matching_terms(self, prefix: str) -> Iterable[str]:
+        position = bisect_left(self.terms, prefix)
+        while position < len(self.terms) and self.terms[position].startswith(prefix):
+            yield self.terms[position]
+            position += 1
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[int]:
+        # Entries matching every term of the query, each term being a prefix
+        result: Optional[Set[int]] = None
+        for token in set(tokenize(query)):
+            matches: Set[int] = set()
+            for term in self._matching_terms(token):
+                matches.update(self.postings[term])
+            result = matches if result is None else result & matches
+            if not result:
+                return []
+
+        # Most recent releases first
+        ids = sorted(
+            result or (),
+            key=lambda i: (self.entries[i][RELEASE_DATE], i),
+            reverse=True,
+        )
+        return ids[:limit] if limit else ids
+
+    def entry(self, entry_id: int) -> Dict:
+        label, collection, version, release_date, category, component, text = (
+            self.entries[entry_id]
+        )
+        return {
+            "label": label,
+            "collection": collection,
+            "version": version,
+            "release_date": release_date,
+            "category": category,
+            "component": component,
+            "text": text,
+        }
+
+    def hits_over_time(self, ids: Iterable[int]) -> List[Tuple[str, str, int]]:
+        # Number of matching entries by month (YYYY-MM) and label
+        hits = Counter(
+            (self.entries[i][RELEASE_DATE][:7], self.entries[i][LABEL])
+            for i in ids
+            if self.entries[i][RELEASE_DATE]
+        )
+        return [(month, label, count) for (month, label), count in sorted(hits.items())]
@@ -0,0 +1,95 @@
+import json
+import os
+import pickle
+import struct
+import time
+from typing import Dict
+
+
+# Versioned snapshot of the analysis results (InsightsGenerator counts and
+# code quality stats), used to start the dashboard without re-analyzing the
+# collections.
+#
+# Layout: MAGIC | header length (4 bytes, big endian) | JSON header | payload
+# The JSON header carries the schema version, the collection tags the results
+# were built from and a fingerprint of all the tags of each collection (see
+# tags_fingerprint), so it can be checked without loading the payload.
+# The payload is a pickle of the results, pandas frames included.
+MAGIC = b"CLASNAP\0"
+SCHEMA_VERSION = 6
+DEFAULT_SNAPSHOT_FILE = "analysis.snapshot"
+
+_HEADER_LENGTH = struct.Struct(">I")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def write_snapshot(
+    path: str, counts: Dict, stats: Dict, top_n: int, tags: Dict, tag_refs: Dict
+):
+    header = json.dumps(
+        {
+            "schema_version": SCHEMA_VERSION,
+            "created_at": time.time(),
+            "top_n": top_n,
+            "tags": tags,
+            "tag_refs": tag_refs,
+        }
+    ).encode("utf-8")
+    payload = pickle.dumps(
+        {"counts": counts, "stats": stats}, protocol=pickle.HIGHEST_PROTOCOL
+    )
+
+    # Write to a temporary file first so readers never see a partial snapshot
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(MAGIC)
+        file.write(_HEADER_LENGTH.pack(len(header)))
+        file.write(header)
+        file.write(payload)
+    os.replace(temp_path, path)
+
+
+def _read_header(file) -> Dict:
+    if file.read(len(MAGIC)) != MAGIC:
+        raise SnapshotError(f"{file.name} is not a snapshot file")
+    try:
+        (length,) = _HEADER_LENGTH.unpack(file.read(_HEADER_LENGTH.size))
+        header = json.loads(file.read(length).decode("utf-8"))
+    except (struct.error, ValueError) as e:
+        raise SnapshotError(f"{file.name} has a corrupted header: {e}")
+    if header.get("schema_version") != SCHEMA_VERSION:
+        raise SnapshotError(
+            f"{file.name} has schema version {header.get('schema_version')}, "
+            f"expected {SCHEMA_VERSION}. Run collect again to rebuild it."
+        )
+    return header
+
+
+def read_snapshot_header(path: str) -> Dict:
+    with open(path, "rb") as file:
+        return _read_header(file)
+
+
+def read_snapshot(path: str) -> Dict:
+    with open(path, "rb") as file:
+        header = _read_header(file)
+        results = pickle.load(file)
+    return {
+        **results,
+        "top_n": header["top_n"],
+        "tags": header["tags"],
+        "tag_refs": header["tag_refs"],
+    }
+
+
+def stale_collections(header: Dict, tag_refs: Dict) -> Dict:
+    # Collections whose tags differ from the ones in the snapshot, by their
+    # tags fingerprint
+    return {
+        collection: fingerprint
+        for collection, fingerprint in tag_refs.items()
+        if header["tag_refs"].get(collection) != fingerprint
+    }
@@ -1,74 +1,76 @@
-import json
+import ast
 import logging
-import os
-import git
-import shutil
 import subprocess
-import tempfile
-from typing import Dict, Union
+from typing import Dict
+from radon.metrics import h_visit_ast, mi_compute
+from radon.raw import analyze
+from radon.visitors import ComplexityVisitor
 
+from repository import GitRepository
+from topn import DEFAULT_TOP_N, TopN
 
-def get_top_complex_files(complexity_data, num_files=5):
-    file_complexities = []
 
-    # Calculate total complexity for each file
-    for file, metrics in complexity_data.items():
-        total_complexity = sum(item["complexity"] for item in metrics)
-        file_complexities.append((file, total_complexity))
+# Folders ignored during the code analysis
+IGNORED_DIRS = ("tests",)
+IGNORED_PATHS = ("plugins/doc_fragments",)
 
-    # Sort files by complexity (descending) and get top num_files
-    sorted_files = sorted(file_complexities, key=lambda x: x[1], reverse=True)[
-        :num_files
-    ]
+# Raw metrics summed up per collection
+RAW_METRICS = ("loc", "lloc", "sloc", "comments", "multi", "blank")
 
-    return sorted_files
+
+def is_ignored_dir(path: str) -> bool:
+    # Same folders `radon cc -i tests -i plugins/doc_fragments` used to skip
+    name = path.rsplit("/", 1)[-1]
+    return name.startswith(".") or name in IGNORED_DIRS or path in IGNORED_PATHS
+
+
+def compute_file_metrics(source: str) -> Dict:
+    # Parse the file once for the complexity and Halstead metrics, and tokenize
+    # it for the raw metrics, this is what `radon cc`, `radon mi` and
+    # `radon raw` would compute separately
+    tree = ast.parse(source)
+    complexity = ComplexityVisitor.from_ast(tree)
+    raw = analyze(source)
+
+    # Same parameters as radon.metrics.mi_parameters (multiline strings count
+    # as comments, like `radon mi` does by default)
+    comment_lines = raw.comments + raw.multi
+    comments = comment_lines / float(raw.sloc) * 100 if raw.sloc != 0 else 0
+    maintainability_index = mi_compute(
+        h_visit_ast(tree).total.volume,
+        complexity.total_complexity,
+        raw.lloc,
+        comments,
+    )
+
+    return {
+        "complexity": sum(block.complexity for block in complexity.blocks),
+        "blocks": len(complexity.blocks),
+        "maintainability_index": maintainability_index,
+        **{metric: getattr(raw, metric) for metric in RAW_METRICS},
+    }
 
 
 class CodeQualityAnalyzer:
-    def __init__(self, collection: Dict, limit=None):
+    def __init__(self, collection: Dict, repo: GitRepository, top_n=DEFAULT_TOP_N):
         self.collection = collection
-        self.limit = limit
+        self.repo = repo
+        self.top_n = top_n
         self.logger = logging.getLogger(self.__class__.__name__)
         self.logger.setLevel(logging.DEBUG)
 
     def analyze_collections(self) -> Dict:
-        temp_dir = None
         results: Dict = {}
+        tag = None
 
         try:
-            temp_dir = tempfile.mkdtemp(prefix=f'{self.collection["name"]}_repo_')
-            repo_path = os.path.join(temp_dir, self.collection["name"])
-
-            # Clone repository if it doesn't exist
-            if not os.path.exists(repo_path):
-                subprocess.run(
-                    ["git", "clone", self.collection["github_repo"], repo_path]
-                )
-
-            repo = git.Repo(repo_path)
-            tags = repo.git.tag(sort="creatordate").split("\n")
+            tags = self.repo.tags()
 
             # Get the latest tag
             tag = tags[-1]
-            # Checkout to the specific tag
-            subprocess.run(["git", "checkout", tag], cwd=repo_path)
-
-            # Run code coverage analysis
-            # coverage = self.run_coverage_analysis(repo_path)
-
-            # Run code complexity analysis
-            avg_complexity, top_complex_files = self.run_complexity_analysis(repo_path)
 
-            # Run code maintainability index analysis
-            # maintainability_index = self.run_maintainability_index(repo_path)
-
-            # Combine results
-            results = {
-                # "coverage": coverage,
-                "avg_complexity": avg_complexity,
-                "complex_files": top_complex_files,
-                # "maintainability_index": maintainability_index,
-            }
+            # Run code complexity, maintainability index and raw metrics analysis
+            results = self.run_code_metrics_analysis(tag)
 
             return results
 
@@ -78,95 +80,47 @@ class CodeQualityAnalyzer:
             )
         except Exception as e:
             self.logger.error(f"An unexpected error occurred: {e}")
-        finally:
-            if temp_dir:
-                shutil.rmtree(temp_dir)  # Delete temporary directory
-
-    def run_coverage_analysis(self, repo_path) -> Union[int, float]:
-        try:
-            # Run pytest with coverage and generate JSON report
-            subprocess.run(
-                ["pytest", "--cov=.", "--cov-report=json"], cwd=repo_path, check=True
-            )
 
-            # Read the JSON output
-            with open(os.path.join(repo_path, "coverage.json")) as f:
-                coverage_data = json.load(f)
-
-            return coverage_data["totals"]["percent_covered"]
-        except subprocess.CalledProcessError as e:
-            self.logger.error(f"An error occurred during coverage analysis: {e}")
-            return 0
-
-    def run_maintainability_index(self, repo_path):
-        try:
-            # Run radon to collect maintainability index metrics
-            mi_result = subprocess.run(
-                ["radon", "mi", "-s", "-j", "."],
-                cwd=repo_path,
-                capture_output=True,
-                text=True,
-                check=True,
-            )
-
-            # Parse the JSON output
-            mi_data = json.loads(mi_result.stdout)
-
-            # Calculate average maintainability index
-            total_mi = 0
-            num_modules = 0
-            for module_data in mi_data.values():
-                total_mi += module_data["mi"]
-                num_modules += 1
-
-            average_mi = total_mi / num_modules if num_modules > 0 else 0
-
-            return average_mi
-        except subprocess.CalledProcessError as e:
-            self.logger.error(f"An error occurred during complexity analysis: {e}")
-            return 0
-
-    def run_complexity_analysis(self, repo_path) -> Union[int, float]:
-        try:
-            # Run radon to collect complexity metrics
-            result = subprocess.run(
-                [
-                    "radon",
-                    "cc",
-                    "-s",
-                    "-j",
-                    "-i",
-                    "tests",
-                    "-i",
-                    "plugins/doc_fragments",
-                    "--total-average",
-                    "-a",
-                    ".",
-                ],
-                cwd=repo_path,
-                capture_output=True,
-                text=True,
-                check=True,
-            )
-
-            # Parse the JSON output
-            data = json.loads(result.stdout)
-
-            # Calculate average complexity
-            total_complexity = 0
-            num_functions = 0
-            for file_data in data.values():
-                for func_data in file_data:
-                    total_complexity += func_data["complexity"]
-                    num_functions += 1
-
-            avg_complexity = (
-                total_complexity / num_functions if num_functions > 0 else 0
-            )
-
-            top_complex_files = get_top_complex_files(data)
-
-            return avg_complexity, top_complex_files
-        except subprocess.CalledProcessError as e:
-            self.logger.error(f"An error occurred during complexity analysis: {e}")
-            return 0
+    def run_code_metrics_analysis(self, tag) -> Dict:
+        total_complexity = 0
+        num_functions = 0
+        total_mi = 0
+        num_modules = 0
+        raw_metrics = dict.fromkeys(RAW_METRICS, 0)
+        top_complex_files = TopN(self.top_n)
+        file_complexity = {}
+
+        # Read every Python file of the tag through the repository batch reader,
+        # parse it once and keep only the top N files by total complexity
+        for path, sha in self.repo.walk(tag, skip_dir=is_ignored_dir):
+            if not path.endswith(".py") or path.rsplit("/", 1)[-1].startswith("."):
+                continue
+            source = self.repo.read_blob(sha)
+            if source is None:
+                continue
+            try:
+                metrics = compute_file_metrics(str(source, "utf-8", "replace"))
+            except (SyntaxError, ValueError) as e:
+                self.logger.debug(f"Skipping {path}, unable to parse it: {e}")
+                continue
+
+            total_complexity += metrics["complexity"]
+            num_functions += metrics["blocks"]
+            total_mi += metrics["maintainability_index"]
+            num_modules += 1
+            for metric in RAW_METRICS:
+                raw_metrics[metric] += metrics[metric]
+            top_complex_files.push(self.collection["name"], path, metrics["complexity"])
+            file_complexity[path] = metrics["complexity"]
+
+        # Calculate average complexity and maintainability index
+        avg_complexity = total_complexity / num_functions if num_functions > 0 else 0
+        average_mi = total_mi / num_modules if num_modules > 0 else 0
+
+        return {
+            "avg_complexity": avg_complexity,
+            "complex_files": top_complex_files.top(self.collection["name"]),
+            "file_complexity": file_complexity,
+            "maintainability_index": average_mi,
+            "raw_metrics": raw_metrics,
+        }
@@ -0,0 +1,54 @@
+import heapq
+from collections import Counter, defaultdict
+from typing import Dict, Hashable, Iterable, Iterator, List, Tuple
+
+
+DEFAULT_TOP_N = 5
+
+
+# Streaming top-N per group. Occurrences are counted with hash counters in a
+# single pass (`count`), while already final values such as the complexity of a
+# file are kept in bounded min-heaps of size N (`push`), so memory per group never
+# exceeds N entries for them. Both can be fed incrementally, one collection at
+# a time.
+class TopN:
+    def __init__(self, n: int = DEFAULT_TOP_N):
+        self.n = n
+        self._counters: Dict[Hashable, Counter] = defaultdict(Counter)
+        self._heaps: Dict[Hashable, List[Tuple]] = defaultdict(list)
+        self._order = 0
+
+    def count(self, group: Hashable, keys: Iterable[str]):
+        self._counters[group].update(keys)
+
+    def push(self, group: Hashable, key: str, value):
+        heap = self._heaps[group]
+        # The insertion order breaks ties so the first pushed entry wins
+        self._order -= 1
+        entry = (value, self._order, key)
+        if len(heap) < self.n:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heappushpop(heap, entry)
+
+    def top(self, group: Hashable) -> List[Tuple[str, int]]:
+        if group in self._heaps:
+            return [
+                (key, value)
+                for value, _, key in sorted(self._heaps[group], reverse=True)
+            ]
+        # Highest counts first, ties broken by key name
+        return heapq.nsmallest(
+            self.n, self._counters[group].items(), key=lambda x: (-x[1], x[0])
+        )
+
+    def counts(self, group: Hashable) -> Dict[str, int]:
+        # Every counted key of the group, not only the top N
+        return dict(self._counters.get(group, {}))
+
+    def groups(self) -> List[Hashable]:
+        return sorted(set(self._counters) | set(self._heaps))
+
+    def items(self) -> Iterator[Tuple[Hashable, List[Tuple[str, int]]]]:
+        for group in self.groups():
+            yield group, self.top(group)
@@ -0,0 +1,131 @@
+import logging
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from repository import GitRepository, tags_fingerprint
+from snapshot import DEFAULT_SNAPSHOT_FILE, stale_collections, write_snapshot
+
+
+# Seconds between two checks of the collections for new tags
+DEFAULT_WATCH_INTERVAL = 900
+# Seconds between two checks of open browsers for updated data
+BROWSER_REFRESH_INTERVAL = 30
+
+
+def remote_tag_refs(collection: Dict) -> Optional[str]:
+    # Fingerprint of the tags of the repository of the collection, listed with
+    # `git ls-remote` so nothing is cloned or fetched. It is the one recorded
+    # for the clone the collection was analyzed from.
+    try:
+        tags = GitRepository.remote_tags(collection["github_repo"])
+    except subprocess.CalledProcessError as e:
+        logging.getLogger("Watcher").warning(
+            f"Unable to list the tags of {collection['name']}: "
+            f"{e.stderr.decode('utf-8', 'replace').strip()}"
+        )
+        return None
+    except subprocess.TimeoutExpired as e:
+        # Skipped for this check, rather than blocking every later one
+        logging.getLogger("Watcher").warning(
+            f"Unable to list the tags of {collection['name']}: "
+            f"no answer after {e.timeout}s"
+        )
+        return None
+    return tags_fingerprint(tags)
+
+
+# Keeps a running dashboard up to date. The collections are checked for new
+# tags every interval seconds, only the collections whose tags changed (a tag
+# added, removed or moved, backports included) are cloned
+# and analyzed again, and the insights rebuilt from the results of all the
+# collections are swapped into the Plotter, while it keeps serving requests.
+class Watcher:
+    def __init__(
+        self,
+        changelog_parser,
+        snapshot_file: str = DEFAULT_SNAPSHOT_FILE,
+        interval: int = DEFAULT_WATCH_INTERVAL,
+    ):
+        self.changelog_parser = changelog_parser
+        self.snapshot_file = snapshot_file
+        self.interval = interval
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.setLevel(logging.DEBUG)
+        # Results of the last analysis of each collection, by name
+        self.results: Dict = {}
+        self.plotter = None
+
+    def remote_tag_refs(self) -> Dict[str, str]:
+        collections = self.changelog_parser.load_collections_from_yaml()
+        collections = collections["collections"]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            tag_refs = executor.map(remote_tag_refs, collections)
+        return {
+            collection["name"]: fingerprint
+            for collection, fingerprint in zip(collections, tag_refs)
+            if fingerprint is not None
+        }
+
+    def start(self):
+        # Analyze every collection, then start checking for new tags in the
+        # background. Returns the Plotter to serve, or None without any data.
+        self.results = self.changelog_parser.process_collections()
+        results = self.changelog_parser.merge_results(self.results)
+        if not results:
+            return None
+        write_snapshot(self.snapshot_file, **results)
+
+        from plotter import Plotter
+
+        self.plotter = Plotter(
+            results["counts"],
+            results["stats"],
+            results["top_n"],
+            refresh_interval=BROWSER_REFRESH_INTERVAL,
+        )
+        threading.Thread(target=self._run, name="watcher", daemon=True).start()
+        return self.plotter
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                self.logger.error(f"Unable to refresh the collections: {e}")
+
+    def refresh(self) -> bool:
+        # Analyze the collections whose tags changed again, True if any was
+        # updated. Each result carries the tags fingerprint of the clone it was
+        # built from, as the snapshot header.
+        header = {
+            "tag_refs": {
+                name: result["tag_refs"] for name, result in self.results.items()
+            }
+        }
+        changed = stale_collections(header, self.remote_tag_refs())
+        if not changed:
+            self.logger.debug("No tag changed")
+            return False
+
+        self.logger.info(f"Tags changed: {sorted(changed)}")
+        # Queued jobs not done by the next check are failed, instead of
+        # blocking the watcher, e.g. when no worker is running any more
+        results = self.changelog_parser.process_collections(
+            list(changed), queue_timeout=self.interval
+        )
+        if not results:
+            return False
+        # Collections that failed keep their previous results and are tried
+        # again on the next check
+        self.results.update(results)
+
+        merged = self.changelog_parser.merge_results(self.results)
+        if not merged:
+            return False
+        write_snapshot(self.snapshot_file, **merged)
+        self.plotter.update(merged["counts"], merged["stats"])
+        return True
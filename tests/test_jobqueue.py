@@ -0,0 +1,112 @@
+import multiprocessing
+import os
+import time
+
+from jobqueue import JobQueue
+
+
+COLLECTIONS = [
+    {"name": f"collection.{i}", "github_repo": "", "size_mb": i + 1} for i in range(6)
+]
+
+
+def run_worker(path: str, worker: str, die: bool = False):
+    # Simplified `main.py worker` loop, a dying worker exits holding its lease
+    queue = JobQueue(path, lease_seconds=1)
+    idle_since = time.time()
+    while time.time() - idle_since < 3:
+        job = queue.claim(worker)
+        if job is None:
+            time.sleep(0.1)
+            continue
+        if die:
+            os._exit(1)
+        run, name, collection, args = job
+        with queue.lease(run, name, worker):
+            queue.complete(run, name, worker, {"name": name, "top": [("a.py", 1)]})
+        idle_since = time.time()
+
+
+def test_results_are_read_back_as_json(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    run = queue.enqueue(COLLECTIONS[:1], {})
+    claimed_run, name, collection, args = queue.claim("worker")
+    assert (claimed_run, name, collection, args) == (
+        run,
+        "collection.0",
+        COLLECTIONS[0],
+        {},
+    )
+    assert queue.complete(run, name, "worker", {"top": [("a.py", 1)]})
+    assert queue.wait(run, poll_interval=0.1)
+    assert queue.results(run) == {"collection.0": {"top": [["a.py", 1]]}}
+
+
+def test_runs_sharing_a_queue_file_are_independent(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    first = queue.enqueue(COLLECTIONS[:2], {})
+    second = queue.enqueue(COLLECTIONS[:2], {})
+    while (job := queue.claim("worker")) is not None:
+        run, name, _, _ = job
+        if run == first:
+            queue.complete(run, name, "worker", name)
+        else:
+            queue.fail(run, name, "worker", "error")
+    assert queue.results(first) == {
+        "collection.0": "collection.0",
+        "collection.1": "collection.1",
+    }
+    assert queue.results(second) == {}
+
+    queue.remove(first)
+    assert queue.results(first) == {}
+    assert queue.unfinished() == 0
+
+
+def test_expired_lease_is_claimed_again_until_max_attempts(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), lease_seconds=0, max_attempts=2)
+    run = queue.enqueue(COLLECTIONS[:1], {})
+    assert queue.claim("first")[1] == "collection.0"
+    time.sleep(0.01)
+    assert queue.claim("second")[1] == "collection.0"
+    # The first worker lost its lease, its result is discarded
+    assert not queue.complete(run, "collection.0", "first", "late")
+    time.sleep(0.01)
+    assert queue.claim("third") is None
+    assert queue.unfinished() == 0
+    assert queue.results(run) == {}
+
+
+def test_wait_fails_the_jobs_left_without_workers(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), lease_seconds=1)
+    run = queue.enqueue(COLLECTIONS[:2], {})
+    assert not queue.wait(run, poll_interval=0.1)
+    assert queue.unfinished() == 0
+
+
+def test_workers_in_several_processes(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    queue = JobQueue(path, lease_seconds=1)
+    run = queue.enqueue(COLLECTIONS, {})
+
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=run_worker, args=(path, "dying", True)),
+        *(
+            context.Process(target=run_worker, args=(path, f"worker-{i}"))
+            for i in range(3)
+        ),
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        assert queue.wait(run, poll_interval=0.1, timeout=30)
+    finally:
+        for worker in workers:
+            worker.join()
+
+    results = queue.results(run)
+    assert sorted(results) == [collection["name"] for collection in COLLECTIONS]
+    assert results["collection.0"] == {"name": "collection.0", "top": [["a.py", 1]]}
+    # The job of the dying worker was claimed again once its lease expired
+    assert workers[0].exitcode == 1